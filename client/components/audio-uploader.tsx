@@ -8,6 +8,79 @@ import { Button } from "@/components/ui/button";
 import { Progress } from "@/components/ui/progress";
 import { Alert, AlertDescription, AlertTitle } from "@/components/ui/alert";
 import { CherryBlossom } from "./cherry-blossom";
+import { sha256Blob } from "@/lib/sha256";
+
+const API_URL = "http://127.0.0.1:5000";
+const UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024;
+const MAX_UPLOAD_RETRIES = 5;
+
+async function sha256Hex(data: BufferSource) {
+  const digest = await crypto.subtle.digest("SHA-256", data);
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => byte.toString(16).padStart(2, "0"))
+    .join("");
+}
+
+function sleep(ms: number) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+// Where an unfinished upload of this file is kept across reloads
+function uploadKey(file: File) {
+  return `haruUpload:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+// The server's view of an upload, or null once it no longer knows it
+async function uploadStatus(uploadId: string) {
+  const response = await fetch(`${API_URL}/uploads/${uploadId}`);
+  if (response.status === 404) return null;
+  const data = await response.json();
+  if (!response.ok) {
+    throw new Error(data.error || "Upload failed");
+  }
+  return data;
+}
+
+// Announce the upload; the server skips it if it has the song already
+async function startUpload(file: File) {
+  const startResponse = await fetch(`${API_URL}/uploads`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      filename: file.name,
+      size: file.size,
+      // Hashed a slice at a time, so long masters are never held in
+      // memory whole
+      sha256: await sha256Blob(file, UPLOAD_CHUNK_SIZE),
+    }),
+  });
+  const data = await startResponse.json();
+  if (!startResponse.ok) {
+    throw new Error(data.error || "Upload failed");
+  }
+  if (!data.proof) return data;
+
+  // The server has this song: prove we hold it by hashing the range it
+  // asks for. If that fails it falls back to a regular upload.
+  const { offset, length } = data.proof;
+  const proofResponse = await fetch(
+    `${API_URL}/uploads/${data.upload_id}/proof`,
+    {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        sha256: await sha256Hex(
+          await file.slice(offset, offset + length).arrayBuffer()
+        ),
+      }),
+    }
+  );
+  const proofData = await proofResponse.json();
+  if (!proofResponse.ok) {
+    throw new Error(proofData.error || "Upload failed");
+  }
+  return proofData;
+}
 
 export default function AudioUploader() {
   const [file, setFile] = useState<File | null>(null);
@@ -36,42 +109,69 @@ export default function AudioUploader() {
     setUploadProgress(0);
     setError(null);
 
-    const formData = new FormData();
-    formData.append("file", file);
-
+    const key = uploadKey(file);
     try {
-      const xhr = new XMLHttpRequest();
-
-      // Create a promise to handle the XHR request
-      const uploadPromise = new Promise((resolve, reject) => {
-        xhr.upload.addEventListener("progress", (event) => {
-          if (event.lengthComputable) {
-            const progress = (event.loaded / event.total) * 100;
-            setUploadProgress(Math.round(progress));
+      // Pick up an upload a dropped connection or a reload interrupted
+      const savedId = sessionStorage.getItem(key);
+      let data = savedId ? await uploadStatus(savedId) : null;
+      if (!data) {
+        sessionStorage.removeItem(key);
+        data = await startUpload(file);
+      }
+      if (!data.complete) {
+        sessionStorage.setItem(key, data.upload_id);
+      }
+
+      // Send the file in chunks, resuming from the server's offset
+      let retries = 0;
+      while (!data.complete) {
+        const offset: number = data.offset;
+        setUploadProgress(Math.round((offset / file.size) * 100));
+        const end = Math.min(offset + UPLOAD_CHUNK_SIZE, file.size);
+        let chunkResponse: Response;
+        try {
+          chunkResponse = await fetch(`${API_URL}/uploads/${data.upload_id}`, {
+            method: "PUT",
+            headers: {
+              "Content-Type": "application/octet-stream",
+              "Content-Range": `bytes ${offset}-${end - 1}/${file.size}`,
+            },
+            body: file.slice(offset, end),
+          });
+        } catch (err) {
+          // fetch only throws on network errors: back off, then ask the
+          // server how much of the chunk arrived before retrying
+          if (!(err instanceof TypeError) || retries >= MAX_UPLOAD_RETRIES) {
+            throw err;
           }
-        });
-
-        xhr.addEventListener("load", () => {
-          if (xhr.status >= 200 && xhr.status < 300) {
-            resolve(JSON.parse(xhr.response));
-          } else {
-            reject(
-              new Error(
-                xhr.response ? JSON.parse(xhr.response).error : "Upload failed"
-              )
-            );
+          await sleep(1000 * 2 ** retries);
+          retries++;
+          const status = await uploadStatus(data.upload_id).catch(
+            () => undefined
+          );
+          if (status === null) {
+            throw new Error("The upload expired, please try again");
           }
-        });
-
-        xhr.addEventListener("error", () => {
-          reject(new Error("Upload failed"));
-        });
-      });
-
-      xhr.open("POST", "http://127.0.0.1:5000/upload");
-      xhr.send(formData);
+          if (status) {
+            data = { ...data, offset: status.offset };
+          }
+          continue;
+        }
+        retries = 0;
+        const chunkData = await chunkResponse.json();
+        if (chunkResponse.status === 409 && chunkData.offset != null) {
+          data = { ...data, offset: chunkData.offset };
+          continue;
+        }
+        if (!chunkResponse.ok) {
+          throw new Error(chunkData.error || "Upload failed");
+        }
+        data = { ...data, ...chunkData };
+      }
+      sessionStorage.removeItem(key);
 
-      await uploadPromise;
+      // The generator reads the session to render this upload
+      sessionStorage.setItem("haruSessionId", data.session_id);
       setUploadProgress(100);
       setUploadComplete(true);
     } catch (err) {
@@ -18,6 +18,7 @@ import {
 } from "lucide-react";
 import { CherryBlossom } from "./cherry-blossom";
 import VideoPreview from "./video-preview";
+import { canPlayLivePreview } from "@/lib/live-preview";
 
 type VideoFormat = "youtube" | "horizontal" | "vertical";
 type VideoType = "lyrics" | "music";
@@ -26,6 +27,38 @@ interface VideoGeneratorProps {
   onVideoGenerated: (url: string, type: VideoType) => void;
 }
 
+const API_URL = "http://127.0.0.1:5000";
+
+// Poll the render job until the server reports it finished, passing its
+// live preview URL to onPreview as soon as one is available
+async function waitForJob(
+  jobId: string,
+  intervalMs = 3000,
+  onPreview?: (url: string) => void
+) {
+  let previewShown = false;
+  while (true) {
+    const response = await fetch(`${API_URL}/jobs/${jobId}`);
+    if (!response.ok) {
+      const errorData = await response.json();
+      throw new Error(errorData.error || "Failed to fetch job status");
+    }
+
+    const job = await response.json();
+    if (job.preview_url && onPreview && !previewShown) {
+      previewShown = true;
+      onPreview(`${API_URL}${job.preview_url}`);
+    }
+    if (job.status === "completed") {
+      return job.result;
+    }
+    if (job.status === "failed") {
+      throw new Error(job.error || "Failed to generate video");
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
 export default function VideoGenerator({
   onVideoGenerated,
 }: VideoGeneratorProps) {
@@ -39,22 +72,25 @@ export default function VideoGenerator({
   const [videoData, setVideoData] = useState(null);
   const [error, setError] = useState<string | null>(null);
   const [videoUrl, setVideoUrl] = useState<string | null>(null);
+  // Session and format of the last finished render, as "session:format"
+  const [lastRender, setLastRender] = useState<string | null>(null);
 
-  const handleGenerate = async () => {
+  const runRender = async (endpoint: string, body: object) => {
     setGenerating(true);
     setError(null);
 
     try {
-      console.log("Sending video format:", videoFormat);
-      const response = await fetch("http://127.0.0.1:5000/generate", {
+      const sessionId = sessionStorage.getItem("haruSessionId");
+      const response = await fetch(`${API_URL}/${endpoint}`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
         },
+        // Only ask for the live preview if this browser can play it
         body: JSON.stringify({
-          format: videoFormat,
-          brightness: brightness[0],
-          contrast: contrast[0],
+          session_id: sessionId,
+          preview: canPlayLivePreview(),
+          ...body,
         }),
       });
 
@@ -63,10 +99,12 @@ export default function VideoGenerator({
         throw new Error(errorData.error || "Failed to generate video");
       }
 
-      const data = await response.json();
+      const { job_id } = await response.json();
+      const data = await waitForJob(job_id, 3000, setVideoUrl);
 
       console.log(data);
       setGenerated(true);
+      setLastRender(`${sessionId}:${videoFormat}`);
       const url = data.videoUrl;
       setVideoUrl(url);
       onVideoGenerated(url, videoType);
@@ -77,6 +115,25 @@ export default function VideoGenerator({
     }
   };
 
+  const handleGenerate = () => {
+    console.log("Sending video format:", videoFormat);
+    const sessionId = sessionStorage.getItem("haruSessionId");
+    // Only the color grade changed since the last render: regrade it
+    // instead of generating every scene again
+    const endpoint =
+      lastRender === `${sessionId}:${videoFormat}` ? "regrade" : "generate";
+    return runRender(endpoint, {
+      format: videoFormat,
+      // Drafts are quick and cheap; "Render Final" upgrades them
+      tier: "draft",
+      brightness: brightness[0],
+      contrast: contrast[0],
+    });
+  };
+
+  // Re-render every drafted scene with the full-quality model
+  const handleRenderFinal = () => runRender("final", {});
+
   return (
     <div className="space-y-8">
       {videoUrl && (
@@ -347,6 +404,17 @@ export default function VideoGenerator({
             </>
           )}
         </Button>
+        {generated && (
+          <Button
+            size="lg"
+            variant="outline"
+            onClick={handleRenderFinal}
+            disabled={generating}
+            className="ml-4 rounded-full px-8 py-6 font-bold border-pink-400 text-pink-700"
+          >
+            Render Final
+          </Button>
+        )}
         <div className="absolute -right-6 top-1/2 transform -translate-y-1/2">
           <CherryBlossom
             className="w-8 h-8 text-pink-400 animate-float-blossom"
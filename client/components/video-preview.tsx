@@ -1,9 +1,10 @@
 "use client";
 
-import { useState, useRef } from "react";
+import { useState, useRef, useEffect } from "react";
 import { Button } from "@/components/ui/button";
 import { Download, Play, Pause, Volume2, VolumeX } from "lucide-react";
 import { Slider } from "@/components/ui/slider";
+import { playLivePreview } from "@/lib/live-preview";
 import {
   Select,
   SelectContent,
@@ -30,6 +31,13 @@ export default function VideoPreview({
   const [quality, setQuality] = useState("720p");
   const [aspectRatio, setAspectRatio] = useState<"16:9" | "9:16">("16:9");
   const videoRef = useRef<HTMLVideoElement>(null);
+  // A playlist URL is the live preview of a render still in progress
+  const isLivePreview = videoUrl?.endsWith(".m3u8") ?? false;
+
+  useEffect(() => {
+    if (!videoRef.current || !videoUrl || !isLivePreview) return;
+    return playLivePreview(videoRef.current, videoUrl);
+  }, [videoUrl, isLivePreview]);
 
   const handleVideoLoad = () => {
     if (videoRef.current) {
@@ -85,7 +93,11 @@ export default function VideoPreview({
         >
           <video
             ref={videoRef}
-            src={`/assets/output/output.mp4`}
+            src={
+              isLivePreview
+                ? undefined
+                : videoUrl ?? `/assets/output/output.mp4`
+            }
             className="w-full h-full object-cover"
             onLoadedMetadata={handleVideoLoad}
             onTimeUpdate={() => {
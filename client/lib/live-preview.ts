@@ -0,0 +1,132 @@
+// Plays the server's live HLS preview while a render is still running.
+// Safari plays the playlist natively. Other browsers get each segment's
+// fragmented MP4 copy (same name, ".mp4" instead of ".ts"), appended to a
+// Media Source Extensions buffer as the playlist grows.
+
+const PLAYLIST_POLL_MS = 2000;
+const PROBE_TYPE = 'video/mp4; codecs="avc1.64001f, mp4a.40.2"';
+
+export function canPlayHlsNatively() {
+  const video = document.createElement("video");
+  return video.canPlayType("application/vnd.apple.mpegurl") !== "";
+}
+
+export function canPlayLivePreview() {
+  return (
+    canPlayHlsNatively() ||
+    (typeof MediaSource !== "undefined" &&
+      MediaSource.isTypeSupported(PROBE_TYPE))
+  );
+}
+
+// Find a box's payload among the boxes in data[start, end)
+function findBox(data: Uint8Array, start: number, end: number, type: string) {
+  const view = new DataView(data.buffer, data.byteOffset, data.byteLength);
+  for (let offset = start; offset + 8 <= end; ) {
+    const size = view.getUint32(offset);
+    const boxType = String.fromCharCode(...data.subarray(offset + 4, offset + 8));
+    if (boxType === type) return [offset + 8, offset + size] as const;
+    if (size < 8) break;
+    offset += size;
+  }
+  return null;
+}
+
+function indexOf(data: Uint8Array, start: number, end: number, type: string) {
+  const codes = Array.from(type, (char) => char.charCodeAt(0));
+  for (let i = start; i + 4 <= end; i++) {
+    if (codes.every((code, j) => data[i + j] === code)) return i;
+  }
+  return -1;
+}
+
+// The segment's MSE type, with the H.264 profile and level from its avcC
+function segmentType(data: Uint8Array) {
+  const moov = findBox(data, 0, data.length, "moov");
+  if (!moov) throw new Error("Preview segment has no moov box");
+  const avcC = indexOf(data, moov[0], moov[1], "avcC");
+  if (avcC === -1) throw new Error("Preview segment is not H.264");
+  const codecs = [
+    "avc1." +
+      Array.from(data.subarray(avcC + 5, avcC + 8), (byte) =>
+        byte.toString(16).padStart(2, "0")
+      ).join(""),
+  ];
+  if (indexOf(data, moov[0], moov[1], "mp4a") !== -1) {
+    codecs.push("mp4a.40.2");
+  }
+  return `video/mp4; codecs="${codecs.join(", ")}"`;
+}
+
+function appendSegment(buffer: SourceBuffer, data: Uint8Array) {
+  return new Promise<void>((resolve, reject) => {
+    buffer.addEventListener("updateend", () => resolve(), { once: true });
+    buffer.addEventListener("error", () => reject(new Error("Append failed")), {
+      once: true,
+    });
+    buffer.appendBuffer(data);
+  });
+}
+
+// Start playing playlistUrl in video; returns a function that stops it
+export function playLivePreview(video: HTMLVideoElement, playlistUrl: string) {
+  if (canPlayHlsNatively()) {
+    video.src = playlistUrl;
+    return () => {};
+  }
+
+  let stopped = false;
+  const mediaSource = new MediaSource();
+  const objectUrl = URL.createObjectURL(mediaSource);
+
+  const run = async () => {
+    let buffer: SourceBuffer | null = null;
+    let appended = 0;
+    while (!stopped) {
+      const response = await fetch(playlistUrl, { cache: "no-store" });
+      if (!response.ok) throw new Error("Preview playlist not found");
+      const playlist = await response.text();
+      const segments = playlist
+        .split("\n")
+        .map((line) => line.trim())
+        .filter((line) => line && !line.startsWith("#"));
+
+      for (; appended < segments.length && !stopped; appended++) {
+        const url = new URL(segments[appended], playlistUrl);
+        url.pathname = url.pathname.replace(/\.ts$/, ".mp4");
+        const segment = await fetch(url);
+        if (!segment.ok) throw new Error("Preview segment not found");
+        const data = new Uint8Array(await segment.arrayBuffer());
+        if (!buffer) {
+          buffer = mediaSource.addSourceBuffer(segmentType(data));
+          // Each segment carries its own init data and timestamps; play
+          // them back to back in playlist order
+          buffer.mode = "sequence";
+        }
+        await appendSegment(buffer, data);
+      }
+
+      if (playlist.includes("#EXT-X-ENDLIST")) {
+        if (!stopped) mediaSource.endOfStream();
+        return;
+      }
+      await new Promise((resolve) => setTimeout(resolve, PLAYLIST_POLL_MS));
+    }
+  };
+
+  mediaSource.addEventListener(
+    "sourceopen",
+    () => {
+      run().catch((err) => {
+        if (!stopped) console.error("Live preview stopped:", err);
+      });
+    },
+    { once: true }
+  );
+  video.src = objectUrl;
+
+  return () => {
+    stopped = true;
+    URL.revokeObjectURL(objectUrl);
+  };
+}
@@ -1,18 +1,30 @@
 import os
-import time
-import shutil
-import requests
-import concurrent.futures
+import hmac
+import secrets
 from flask_cors import CORS
-from flask import Flask, request, jsonify
-
-from google import genai
-from lumaai import LumaAI
-
-from utils.stitch_videos import merge_videos_with_audio
-from generate_content.gen_video import video_generation
-from generate_content.gen_image import test_image_generation
-from generate_content.gen_analysis import generate_music_video_analysis
+from flask import Flask, request, jsonify, send_from_directory
+
+from utils.jobs import JobQueue
+from utils.governor import get_governor
+from utils.sessions import SessionStore
+from utils.checkpoints import RenderCheckpoint
+from utils.hls import PLAYLIST_NAME
+from utils.uploads import UploadError, UploadStore
+from pipeline import (
+    RENDER_TIERS,
+    SongAnalyzer,
+    export_music_video,
+    regenerate_scene,
+    regrade_music_video,
+    render_music_video,
+)
+from utils.stitch_videos import load_stitch_manifest
+from generate_content.asset_cache import AssetCache
+from generate_content.analysis_cache import AnalysisCache
+from generate_content.generation_poller import (
+    generation_from_payload,
+    get_generation_poller,
+)
 from dotenv import load_dotenv
 
 
@@ -27,11 +39,11 @@ app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
 app.config["UPLOAD_FOLDER"] = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), ".."
 )
-app.config["MUSIC_FOLDER"] = os.path.join(
-    app.config["UPLOAD_FOLDER"], "assets", "music"
+app.config["SESSIONS_FOLDER"] = os.path.join(
+    app.config["UPLOAD_FOLDER"], "assets", "sessions"
 )
-app.config["VIDEO_FOLDER"] = os.path.join(
-    app.config["UPLOAD_FOLDER"], "assets", "videos"
+app.config["UPLOADS_FOLDER"] = os.path.join(
+    app.config["UPLOAD_FOLDER"], "assets", "uploads"
 )
 app.config["SESSIONS_FILE"] = os.path.join(
     app.config["UPLOAD_FOLDER"], "sessions.json"
@@ -40,6 +52,9 @@ app.config["SESSIONS_FILE"] = os.path.join(
 app.config["OUTPUT_FOLDER"] = os.path.join(
     app.config["UPLOAD_FOLDER"], "assets", "output"
 )
+app.config["CACHE_FOLDER"] = os.path.join(
+    app.config["UPLOAD_FOLDER"], "assets", "cache"
+)
 
 # Configure Next.js public directory
 app.config["NEXT_PUBLIC_FOLDER"] = os.path.join(
@@ -47,11 +62,81 @@ app.config["NEXT_PUBLIC_FOLDER"] = os.path.join(
 )
 
 # Create necessary folders
-os.makedirs(app.config["MUSIC_FOLDER"], exist_ok=True)
-os.makedirs(app.config["VIDEO_FOLDER"], exist_ok=True)
 os.makedirs(app.config["OUTPUT_FOLDER"], exist_ok=True)
 os.makedirs(app.config["NEXT_PUBLIC_FOLDER"], exist_ok=True)
 
+# Each upload gets its own session workspace
+sessions = SessionStore(
+    app.config["SESSIONS_FOLDER"], app.config["SESSIONS_FILE"]
+)
+
+# Chunked uploads land in a store keyed by content hash
+upload_store = UploadStore(app.config["UPLOADS_FOLDER"])
+
+ALLOWED_AUDIO_EXTENSIONS = {".mp3", ".wav"}
+
+# Renders run in the background on a fixed pool of workers
+app.config["RENDER_WORKERS"] = int(os.environ.get("RENDER_WORKERS", 2))
+job_queue = JobQueue(max_workers=app.config["RENDER_WORKERS"])
+
+# Clips are normalized in up to this many parallel ffmpeg processes
+app.config["STITCH_PROCESSES"] = int(
+    os.environ.get("STITCH_PROCESSES", os.cpu_count() or 1)
+)
+
+# Video generations slower than this percentile of recent ones are hedged
+# with a duplicate, at most HEDGE_BUDGET times per render (0 disables)
+app.config["HEDGE_PERCENTILE"] = float(os.environ.get("HEDGE_PERCENTILE", 0.9))
+app.config["HEDGE_BUDGET"] = int(os.environ.get("HEDGE_BUDGET", 0))
+
+# Song analyses are reused across renders of the same audio
+analysis_cache = AnalysisCache(
+    os.path.join(app.config["CACHE_FOLDER"], "analysis")
+)
+
+# Analyses can start at upload time, while the user picks render options
+app.config["SPECULATIVE_ANALYSIS"] = (
+    os.environ.get("SPECULATIVE_ANALYSIS", "true").lower() == "true"
+)
+app.config["ANALYSIS_STREAMING"] = (
+    os.environ.get("ANALYSIS_STREAMING", "true").lower() == "true"
+)
+song_analyzer = SongAnalyzer(
+    cache=analysis_cache,
+    proxy_folder=os.path.join(app.config["CACHE_FOLDER"], "audio_proxies"),
+    stream=app.config["ANALYSIS_STREAMING"],
+)
+
+# Generated images and videos are reused for identical generation inputs
+app.config["ASSET_CACHE_MAX_BYTES"] = int(
+    os.environ.get("ASSET_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+)
+asset_cache = AssetCache(
+    os.path.join(app.config["CACHE_FOLDER"], "assets"),
+    max_bytes=app.config["ASSET_CACHE_MAX_BYTES"],
+)
+
+# Scenes are also published as a live HLS playlist while the render runs.
+# Each scene is then encoded once more, so it is only done for clients that
+# say they can play the preview (natively or through Media Source
+# Extensions). Set PROGRESSIVE_OUTPUT=false to turn it off entirely.
+app.config["PROGRESSIVE_OUTPUT"] = (
+    os.environ.get("PROGRESSIVE_OUTPUT", "true").lower() == "true"
+)
+
+# With a public base URL for this server, Luma reports finished generations
+# to /luma/callback instead of waiting to be polled. The token in the URL
+# keeps anyone else from completing generations.
+app.config["LUMA_CALLBACK_BASE_URL"] = os.environ.get("LUMA_CALLBACK_BASE_URL")
+app.config["LUMA_CALLBACK_TOKEN"] = os.environ.get(
+    "LUMA_CALLBACK_TOKEN", secrets.token_urlsafe(24)
+)
+if app.config["LUMA_CALLBACK_BASE_URL"]:
+    get_generation_poller().enable_callbacks(
+        f"{app.config['LUMA_CALLBACK_BASE_URL'].rstrip('/')}/luma/callback"
+        f"?token={app.config['LUMA_CALLBACK_TOKEN']}"
+    )
+
 
 @app.route("/upload", methods=["POST"])
 def upload_music():
@@ -63,10 +148,9 @@ def upload_music():
         return jsonify({"error": "No selected file"}), 400
 
     # Check file extension
-    allowed_extensions = {".mp3", ".wav"}
     file_ext = os.path.splitext(file.filename)[1].lower()
 
-    if file_ext not in allowed_extensions:
+    if file_ext not in ALLOWED_AUDIO_EXTENSIONS:
         return (
             jsonify(
                 {
@@ -78,189 +162,726 @@ def upload_music():
 
     if file:
         try:
-            # Generate a unique session ID
-            session_id = str(time.time())
+            # Every upload gets its own session and working directory
+            session_id = sessions.create(original_filename=file.filename)
+            workspace = sessions.workspace(session_id)
 
-            unique_filename = f"{session_id}{file_ext}"
-            filepath = os.path.join(app.config["MUSIC_FOLDER"], unique_filename)
+            filepath = os.path.join(workspace["root"], f"song{file_ext}")
             file.save(filepath)
+            sessions.update(session_id, audio_file=filepath)
+
+            if wants_speculative_analysis(request.form.get("analyze")):
+                song_analyzer.start(session_id, filepath)
 
             return jsonify(
                 {
                     "message": "File uploaded successfully",
+                    "session_id": session_id,
+                    "analysis": song_analyzer.status(session_id),
                 }
             )
         except Exception as e:
             return jsonify({"error": f"Error saving file: {str(e)}"}), 500
 
 
+def wants_speculative_analysis(value):
+    """Read an optional "analyze" flag, defaulting to the server setting."""
+    if value is None:
+        return app.config["SPECULATIVE_ANALYSIS"]
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def create_song_session(
+    audio_file, original_filename, sha256=None, analyze=False
+):
+    """Start a session for an uploaded song and describe it for the client."""
+    session_id = sessions.create(
+        original_filename=original_filename,
+        audio_file=audio_file,
+        sha256=sha256,
+    )
+    if analyze:
+        song_analyzer.start(session_id, audio_file)
+    return {
+        "message": "File uploaded successfully",
+        "session_id": session_id,
+        "complete": True,
+        "analysis": song_analyzer.status(session_id),
+    }
+
+
+@app.route("/uploads", methods=["POST"])
+def start_upload():
+    data = request.get_json() or {}
+    filename = data.get("filename", "")
+    size = data.get("size")
+    sha256 = (data.get("sha256") or "").lower() or None
+    analyze = wants_speculative_analysis(data.get("analyze"))
+
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in ALLOWED_AUDIO_EXTENSIONS:
+        return (
+            jsonify(
+                {
+                    "error": "Invalid file type. Only MP3 and WAV files are allowed."
+                }
+            ),
+            400,
+        )
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({"error": "A positive file size is required"}), 400
+
+    # Identical content was uploaded before: skip the transfer once the
+    # client shows it has the file, not just its hash
+    existing = upload_store.find_by_hash(sha256, file_ext)
+    if existing and os.path.getsize(existing) == size:
+        challenge_id, offset, length = upload_store.challenge(
+            existing,
+            filename=filename,
+            size=size,
+            ext=file_ext,
+            sha256=sha256,
+            analyze=analyze,
+        )
+        return jsonify(
+            {
+                "upload_id": challenge_id,
+                "complete": False,
+                "proof": {"offset": offset, "length": length},
+            }
+        )
+
+    upload_id = upload_store.start(
+        filename, size, file_ext, sha256, analyze=analyze
+    )
+    return (
+        jsonify(
+            {"upload_id": upload_id, "offset": 0, "size": size, "complete": False}
+        ),
+        201,
+    )
+
+
+@app.route("/uploads/<upload_id>/proof", methods=["POST"])
+def prove_upload(upload_id):
+    """Finish a deduplicated upload from the hash of the challenged range.
+
+    A wrong or expired answer falls back to a regular upload.
+    """
+    data = request.get_json() or {}
+    challenge, proven = upload_store.verify(upload_id, data.get("sha256"))
+    if challenge is None:
+        return jsonify({"error": "Upload not found"}), 404
+    if proven:
+        return jsonify(
+            create_song_session(
+                challenge["path"],
+                challenge["filename"],
+                challenge["sha256"],
+                challenge["analyze"],
+            )
+        )
+
+    # The bytes must really be sent, and must match the claimed hash
+    upload_id = upload_store.start(
+        challenge["filename"],
+        challenge["size"],
+        challenge["ext"],
+        challenge["sha256"],
+        analyze=challenge["analyze"],
+    )
+    return (
+        jsonify(
+            {
+                "upload_id": upload_id,
+                "offset": 0,
+                "size": challenge["size"],
+                "complete": False,
+            }
+        ),
+        201,
+    )
+
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    status = upload_store.status(upload_id)
+    if status is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(
+        {
+            "upload_id": upload_id,
+            "offset": status["offset"],
+            "size": status["size"],
+            "complete": False,
+        }
+    )
+
+
+@app.route("/uploads/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    # Chunks carry "Content-Range: bytes <start>-<end>/<total>"
+    content_range = request.headers.get("Content-Range", "")
+    try:
+        offset = int(content_range.split(" ", 1)[1].split("-", 1)[0])
+    except (IndexError, ValueError):
+        return jsonify({"error": "Missing or invalid Content-Range header"}), 400
+
+    try:
+        status = upload_store.append(upload_id, offset, request.stream)
+    except UploadError as e:
+        current = upload_store.status(upload_id)
+        return (
+            jsonify(
+                {
+                    "error": str(e),
+                    "offset": current["offset"] if current else None,
+                }
+            ),
+            409 if current else 400,
+        )
+
+    if "path" in status:
+        return jsonify(
+            create_song_session(
+                status["path"],
+                status["filename"],
+                status["sha256"],
+                status.get("analyze", False),
+            )
+        )
+    return jsonify(
+        {
+            "upload_id": upload_id,
+            "offset": status["offset"],
+            "size": status["size"],
+            "complete": False,
+        }
+    )
+
+
+@app.route("/sessions/<session_id>", methods=["GET"])
+def get_session(session_id):
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify(
+        {
+            "session_id": session_id,
+            "original_filename": session.get("original_filename"),
+            "created_at": session.get("created_at"),
+            "job_id": session.get("job_id"),
+            "analysis": song_analyzer.status(session_id),
+            "scenes": RenderCheckpoint(
+                sessions.workspace(session_id)["checkpoint"]
+            ).summary(),
+        }
+    )
+
+
+def job_is_active(job_id):
+    job = job_queue.get(job_id)
+    return job is not None and job.status in ("queued", "running")
+
+
+def busy_response(job_id):
+    return (
+        jsonify(
+            {
+                "error": "A render is already in progress for this session",
+                "job_id": job_id,
+            }
+        ),
+        409,
+    )
+
+
+def active_job_response(session):
+    """Return a 409 response if the session already has a job underway.
+
+    A session's workspace only holds one render at a time. This is only an
+    early answer; submit_session_job() makes the binding check.
+    """
+    if job_is_active(session.get("job_id")):
+        return busy_response(session["job_id"])
+    return None
+
+
+def submit_session_job(session_id, fn, params, **fields):
+    """Queue fn(job, **params) as the session's job, saving fields with it.
+
+    The check for a job already underway and the new job_id are made
+    atomically, so concurrent requests cannot render into one workspace.
+    Returns (job_id, None), or (None, 409 response) if the session is busy.
+    """
+    claimed, job_id = sessions.claim(
+        session_id,
+        job_is_active,
+        lambda: job_queue.submit(fn, params),
+        **fields,
+    )
+    if not claimed:
+        return None, busy_response(job_id)
+    return job_id, None
+
+
+def render_params(
+    session_id,
+    session,
+    video_format,
+    brightness,
+    contrast,
+    tier="standard",
+    preview=False,
+):
+    """Build the render_music_video() arguments for a session.
+
+    preview asks for the progressive HLS preview, if the server has it on.
+    """
+    # Map video format to aspect ratio
+    aspect_ratio_map = {
+        "youtube": "16:9",
+        "horizontal": "4:3",
+        "vertical": "9:16",
+    }
+    aspect_ratio = aspect_ratio_map.get(video_format, "16:9")
+    print(f"Mapped to aspect ratio: {aspect_ratio}")
+
+    workspace = sessions.workspace(session_id)
+    return {
+        "session_id": session_id,
+        "audio_file_path": session["audio_file"],
+        "aspect_ratio": aspect_ratio,
+        "brightness": brightness,
+        "contrast": contrast,
+        "image_folder": workspace["image_folder"],
+        "video_folder": workspace["video_folder"],
+        "output_folder": workspace["output_folder"],
+        "public_folder": app.config["NEXT_PUBLIC_FOLDER"],
+        "song_analyzer": song_analyzer,
+        "checkpoint_path": workspace["checkpoint"],
+        "stitch_folder": workspace["stitch_folder"],
+        "asset_cache": asset_cache,
+        "stitch_processes": app.config["STITCH_PROCESSES"],
+        "hedge_percentile": app.config["HEDGE_PERCENTILE"],
+        "hedge_budget": app.config["HEDGE_BUDGET"],
+        "hls_folder": (
+            workspace["hls_folder"]
+            if preview and app.config["PROGRESSIVE_OUTPUT"]
+            else None
+        ),
+        "preview_url": f"/sessions/{session_id}/hls/{PLAYLIST_NAME}",
+        "tier": tier,
+    }
+
+
 @app.route("/generate", methods=["POST"])
 def generate_video():
     try:
-        # Get all files in the music directory
-        music_files = os.listdir(app.config["MUSIC_FOLDER"])
-
-        if not music_files:
+        # Get the session, video format and adjustment parameters
+        data = request.get_json()
+        session_id = data.get("session_id")
+        session = sessions.get(session_id)
+        if session is None or not session.get("audio_file"):
             return (
-                jsonify(
-                    {
-                        "error": "No music files found in the assets/music directory"
-                    }
-                ),
+                jsonify({"error": "Unknown session. Please upload a song first."}),
                 400,
             )
 
-        # Get the video format and adjustment parameters from the request
-        data = request.get_json()
         video_format = data.get("format", "youtube")
         brightness = data.get("brightness", 50)
         contrast = data.get("contrast", 50)
+        tier = data.get("tier", "standard")
         print(f"Received video format from frontend: {video_format}")
         print(f"Received brightness: {brightness}, contrast: {contrast}")
+        if tier not in RENDER_TIERS:
+            return jsonify({"error": f"Unknown render tier: {tier}"}), 400
+
+        busy = active_job_response(session)
+        if busy is not None:
+            return busy
+
+        # Later scene regenerations render with the same settings
+        job_id, busy = submit_session_job(
+            session_id,
+            render_music_video,
+            render_params(
+                session_id,
+                session,
+                video_format,
+                brightness,
+                contrast,
+                tier,
+                preview=bool(data.get("preview")),
+            ),
+            format=video_format,
+            brightness=brightness,
+            contrast=contrast,
+            tier=tier,
+        )
+        if busy is not None:
+            return busy
 
-        # Map video format to aspect ratio
-        aspect_ratio_map = {
-            "youtube": "16:9",
-            "horizontal": "4:3",
-            "vertical": "9:16",
-        }
-        aspect_ratio = aspect_ratio_map.get(video_format, "16:9")
-        print(f"Mapped to aspect ratio: {aspect_ratio}")
-
-        # Get the most recent file based on modification time
-        latest_file = max(
-            music_files,
-            key=lambda x: os.path.getmtime(
-                os.path.join(app.config["MUSIC_FOLDER"], x)
+        return (
+            jsonify(
+                {
+                    "message": "Render queued",
+                    "job_id": job_id,
+                    "session_id": session_id,
+                    "status_url": f"/jobs/{job_id}",
+                }
             ),
+            202,
         )
 
-        try:
-            client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-            audio_file_path = os.path.join(
-                app.config["MUSIC_FOLDER"], latest_file
-            )
-            music_video_scenes = generate_music_video_analysis(
-                audio_file_path, client
+    except Exception as e:
+        print(f"Error in generate_video: {str(e)}")
+        return jsonify({"error": f"Error starting render: {str(e)}"}), 500
+
+
+@app.route("/sessions/<session_id>/hls/<path:filename>", methods=["GET"])
+def session_hls(session_id, filename):
+    """Serve the progressive HLS preview of a session's render."""
+    if sessions.get(session_id) is None:
+        return jsonify({"error": "Session not found"}), 404
+    response = send_from_directory(
+        sessions.workspace(session_id)["hls_folder"], filename
+    )
+    if filename.endswith(".m3u8"):
+        # The playlist grows while the render runs
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/sessions/<session_id>/scenes", methods=["GET"])
+def list_scenes(session_id):
+    """Return the session's storyboard, for editing scene prompts."""
+    if sessions.get(session_id) is None:
+        return jsonify({"error": "Session not found"}), 404
+    storyboard = RenderCheckpoint(
+        sessions.workspace(session_id)["checkpoint"]
+    ).storyboard()
+    return jsonify({"session_id": session_id, "scenes": storyboard or []})
+
+
+@app.route("/sessions/<session_id>/scenes/<int:scene_index>", methods=["POST"])
+def regenerate_scene_route(session_id, scene_index):
+    """Regenerate one scene, optionally with edited prompts, and re-stitch.
+
+    Uses the format and grade of the session's last render.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        session = sessions.get(session_id)
+        if session is None or not session.get("audio_file"):
+            return jsonify({"error": "Session not found"}), 404
+
+        busy = active_job_response(session)
+        if busy is not None:
+            return busy
+
+        workspace = sessions.workspace(session_id)
+        storyboard = RenderCheckpoint(workspace["checkpoint"]).storyboard()
+        if storyboard is None:
+            return (
+                jsonify({"error": "Generate a video for this session first"}),
+                409,
             )
-            print(music_video_scenes)
-        except Exception as e:
-            print(f"Error generating music video scenes: {str(e)}")
+        if not 0 <= scene_index < len(storyboard):
+            return jsonify({"error": "Scene not found"}), 404
+
+        video_format = session.get("format", "youtube")
+        brightness = data.get("brightness", session.get("brightness", 50))
+        contrast = data.get("contrast", session.get("contrast", 50))
+        params = render_params(
+            session_id,
+            session,
+            video_format,
+            brightness,
+            contrast,
+            session.get("tier", "standard"),
+        )
+        params.update(
+            scene_index=scene_index,
+            image_prompt=data.get("image_prompt"),
+            video_prompt=data.get("video_prompt"),
+        )
+        job_id, busy = submit_session_job(
+            session_id,
+            regenerate_scene,
+            params,
+            brightness=brightness,
+            contrast=contrast,
+        )
+        if busy is not None:
+            return busy
+
+        return (
+            jsonify(
+                {
+                    "message": f"Regeneration of scene {scene_index} queued",
+                    "job_id": job_id,
+                    "session_id": session_id,
+                    "status_url": f"/jobs/{job_id}",
+                }
+            ),
+            202,
+        )
+
+    except Exception as e:
+        print(f"Error in regenerate_scene: {str(e)}")
+        return jsonify({"error": f"Error starting regeneration: {str(e)}"}), 500
+
+
+@app.route("/final", methods=["POST"])
+def render_final():
+    """Re-render a drafted session's approved scenes at final quality.
+
+    approved_scenes lists scene indices (all scenes if omitted); the rest
+    keep their draft clips. Approved scenes animate their draft images, so
+    the compositions carry over. Uses the format and grade of the
+    session's last render.
+    """
+    try:
+        data = request.get_json()
+        session_id = data.get("session_id")
+        session = sessions.get(session_id)
+        if session is None or not session.get("audio_file"):
+            return jsonify({"error": "Session not found"}), 404
+
+        busy = active_job_response(session)
+        if busy is not None:
+            return busy
+
+        workspace = sessions.workspace(session_id)
+        storyboard = RenderCheckpoint(workspace["checkpoint"]).storyboard()
+        if storyboard is None:
             return (
-                jsonify(
-                    {"error": f"Error generating music video scenes: {str(e)}"}
-                ),
-                500,
+                jsonify({"error": "Generate a draft for this session first"}),
+                409,
             )
 
-        print(music_video_scenes)
+        approved_scenes = data.get("approved_scenes")
+        if approved_scenes is not None and not all(
+            isinstance(i, int) and 0 <= i < len(storyboard)
+            for i in approved_scenes
+        ):
+            return jsonify({"error": "Unknown scene in approved_scenes"}), 400
+
+        params = render_params(
+            session_id,
+            session,
+            session.get("format", "youtube"),
+            session.get("brightness", 50),
+            session.get("contrast", 50),
+            "final",
+            preview=bool(data.get("preview")),
+        )
+        params["approved_scenes"] = approved_scenes
+        job_id, busy = submit_session_job(
+            session_id, render_music_video, params, tier="final"
+        )
+        if busy is not None:
+            return busy
+
+        return (
+            jsonify(
+                {
+                    "message": "Final render queued",
+                    "job_id": job_id,
+                    "session_id": session_id,
+                    "status_url": f"/jobs/{job_id}",
+                }
+            ),
+            202,
+        )
+
+    except Exception as e:
+        print(f"Error in render_final: {str(e)}")
+        return jsonify({"error": f"Error starting final render: {str(e)}"}), 500
+
 
-        # Generate video
-        client = LumaAI()
+@app.route("/regrade", methods=["POST"])
+def regrade():
+    """Re-apply brightness/contrast to a session's last render.
 
-        def generate_and_save_image(scene_data):
-            i, scene = scene_data
-            image_url = test_image_generation(
-                client, scene.image_prompt, aspect_ratio
+    Reuses the stitched intermediates, so no scene is generated again.
+    """
+    try:
+        data = request.get_json()
+        session_id = data.get("session_id")
+        session = sessions.get(session_id)
+        if session is None:
+            return jsonify({"error": "Session not found"}), 404
+
+        busy = active_job_response(session)
+        if busy is not None:
+            return busy
+
+        workspace = sessions.workspace(session_id)
+        if load_stitch_manifest(workspace["stitch_folder"]) is None:
+            return (
+                jsonify({"error": "Generate a video for this session first"}),
+                409,
             )
-            response = requests.get(image_url, stream=True)
-
-            with open(f"./assets/images/image_{i}.jpg", "wb") as file:
-                file.write(response.content)
-            print(f"File downloaded as image_{i}.jpg")
-            return (i, image_url)
-
-        # Create a list of tuples containing index and scene data
-        scene_data = [
-            (i, scene) for i, scene in enumerate(music_video_scenes.scenes)
-        ]
-
-        # Use ThreadPoolExecutor for parallel processing
-        image_urls = {}  # Dictionary to store index -> image_url mapping
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            # Submit all tasks and wait for them to complete
-            futures = [
-                executor.submit(generate_and_save_image, data)
-                for data in scene_data
-            ]
-            # Collect results as they complete
-            for future in concurrent.futures.as_completed(futures):
-                i, url = future.result()
-                image_urls[i] = url
-
-        print("All images generated. Starting video generation...")
-
-        def generate_and_save_video(scene_data):
-            i, scene = scene_data
-            # Get the corresponding image URL for this scene
-            image_url = image_urls[i]
-            try:
-                video_url = video_generation(
-                    client, scene.video_prompt, image_url, aspect_ratio
-                )
-                response = requests.get(video_url, stream=True)
-
-                with open(f"./assets/videos/video_{i}.mp4", "wb") as file:
-                    file.write(response.content)
-                print(f"Video downloaded as video_{i}.mp4")
-                return video_url
-            except Exception as e:
-                print(f"Error generating video for scene {i}: {str(e)}")
-                raise
-
-        # Use ThreadPoolExecutor for parallel video processing
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            # Submit all video generation tasks and wait for them to complete
-            futures = [
-                executor.submit(generate_and_save_video, data)
-                for data in scene_data
-            ]
-            try:
-                concurrent.futures.wait(futures)
-            except Exception as e:
-                print(f"Error in video generation: {str(e)}")
-                return (
-                    jsonify({"error": f"Error generating videos: {str(e)}"}),
-                    500,
-                )
-
-        print("All videos generated successfully!")
-
-        # Create proper output path with filename
-        output_file = os.path.join(app.config["OUTPUT_FOLDER"], "output.mp4")
-        audio_file_path = os.path.join(app.config["MUSIC_FOLDER"], latest_file)
-
-        success = merge_videos_with_audio(
-            video_dir=app.config["VIDEO_FOLDER"],
-            output_path=output_file,
-            audio_file=audio_file_path,
-            normalize=True,
+
+        brightness = data.get("brightness", 50)
+        contrast = data.get("contrast", 50)
+        print(f"Regrading with brightness: {brightness}, contrast: {contrast}")
+
+        job_id, busy = submit_session_job(
+            session_id,
+            regrade_music_video,
+            {
+                "session_id": session_id,
+                "brightness": brightness,
+                "contrast": contrast,
+                "stitch_folder": workspace["stitch_folder"],
+                "output_folder": workspace["output_folder"],
+                "public_folder": app.config["NEXT_PUBLIC_FOLDER"],
+                "stitch_processes": app.config["STITCH_PROCESSES"],
+            },
             brightness=brightness,
             contrast=contrast,
         )
+        if busy is not None:
+            return busy
 
-        if not success:
-            return jsonify({"error": "Failed to merge videos"}), 500
-
-        # Copy the video to the Next.js public directory
-        public_output_file = os.path.join(
-            app.config["NEXT_PUBLIC_FOLDER"], "output.mp4"
+        return (
+            jsonify(
+                {
+                    "message": "Regrade queued",
+                    "job_id": job_id,
+                    "session_id": session_id,
+                    "status_url": f"/jobs/{job_id}",
+                }
+            ),
+            202,
         )
-        shutil.copy2(output_file, public_output_file)
 
-        return jsonify(
+    except Exception as e:
+        print(f"Error in regrade: {str(e)}")
+        return jsonify({"error": f"Error starting regrade: {str(e)}"}), 500
+
+
+@app.route("/export", methods=["POST"])
+def export():
+    """Export the session's video in every format, plus a poster.
+
+    All renditions come from one decode of the existing render, so no
+    scene is generated again.
+    """
+    try:
+        data = request.get_json()
+        session_id = data.get("session_id")
+        session = sessions.get(session_id)
+        if session is None:
+            return jsonify({"error": "Session not found"}), 404
+
+        busy = active_job_response(session)
+        if busy is not None:
+            return busy
+
+        workspace = sessions.workspace(session_id)
+        output_file = os.path.join(workspace["output_folder"], "output.mp4")
+        if not os.path.exists(output_file):
+            return (
+                jsonify({"error": "Generate a video for this session first"}),
+                409,
+            )
+
+        job_id, busy = submit_session_job(
+            session_id,
+            export_music_video,
             {
-                "message": "Found latest music file",
-                "filename": latest_file,
-                "filepath": audio_file_path,
-                "output_file": output_file,
-                "videoUrl": "/assets/output/output.mp4",
-            }
+                "session_id": session_id,
+                "output_folder": workspace["output_folder"],
+                "public_folder": app.config["NEXT_PUBLIC_FOLDER"],
+            },
+        )
+        if busy is not None:
+            return busy
+
+        return (
+            jsonify(
+                {
+                    "message": "Export queued",
+                    "job_id": job_id,
+                    "session_id": session_id,
+                    "status_url": f"/jobs/{job_id}",
+                }
+            ),
+            202,
         )
 
     except Exception as e:
-        print(f"Error in generate_video: {str(e)}")
-        return jsonify({"error": f"Error finding music file: {str(e)}"}), 500
+        print(f"Error in export: {str(e)}")
+        return jsonify({"error": f"Error starting export: {str(e)}"}), 500
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(
+        {"analysis": analysis_cache.stats(), "assets": asset_cache.stats()}
+    )
+
+
+@app.route("/luma/callback", methods=["POST"])
+def luma_callback():
+    token = request.args.get("token", "")
+    if not hmac.compare_digest(token, app.config["LUMA_CALLBACK_TOKEN"]):
+        return jsonify({"error": "Invalid callback token"}), 403
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not payload.get("id"):
+        return jsonify({"error": "Expected a generation object"}), 400
+
+    matched = get_generation_poller().complete(generation_from_payload(payload))
+    return jsonify({"matched": matched})
+
+
+@app.route("/governor", methods=["GET"])
+def governor_stats():
+    return jsonify(get_governor().stats())
+
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    # Only totals: job ids lead to results, and results carry session ids,
+    # which are all that guards a session's routes
+    return jsonify(
+        {
+            "queue_depth": job_queue.queue_depth(),
+            "jobs": job_queue.status_counts(),
+        }
+    )
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    job_data = job.to_dict()
+    if job_data["status"] == "failed":
+        return jsonify({"error": job_data["error"]}), 500
+    if job_data["status"] != "completed":
+        return (
+            jsonify(
+                {"status": job_data["status"], "progress": job_data["progress"]}
+            ),
+            202,
+        )
+    return jsonify(job_data["result"])
 
 
 if __name__ == "__main__":
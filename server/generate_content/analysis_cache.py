@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hash a file's contents without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def analysis_cache_key(audio_hash, model, *prompts, schema_version=1):
+    """Combine the audio hash, model name and prompt text into one key.
+
+    Bump schema_version whenever the storyboard models change, so entries
+    in the old shape are no longer looked up.
+    """
+    digest = hashlib.sha256()
+    for part in (audio_hash, model, *prompts, f"schema-{schema_version}"):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """Persistent on-disk cache of validated song analyses.
+
+    Each entry is a JSON file named after its key. Entries older than
+    max_age_seconds are dropped, and once the cache grows past max_bytes the
+    least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        cache_dir,
+        max_bytes=50 * 1024 * 1024,
+        max_age_seconds=7 * 24 * 3600,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached analysis dict for key, or None."""
+        path = self._path(key)
+        with self._lock:
+            try:
+                if time.time() - os.path.getmtime(path) > self.max_age_seconds:
+                    os.remove(path)
+                    self.misses += 1
+                    return None
+                with open(path, "r") as f:
+                    data = json.load(f)
+                # Touch the entry so LRU eviction keeps it around
+                os.utime(path, None)
+                self.hits += 1
+                return data
+            except (OSError, json.JSONDecodeError):
+                self.misses += 1
+                return None
+
+    def put(self, key, data):
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                os.remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,99 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+
+def generation_cache_key(
+    kind, prompt, aspect_ratio, model, keyframe=None, **options
+):
+    """Build a stable key for a Luma generation from everything it depends on."""
+    payload = json.dumps(
+        [kind, prompt, aspect_ratio, model, keyframe, sorted(options.items())]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AssetCache:
+    """Local LRU cache of downloaded Luma images and videos.
+
+    Each entry is the downloaded asset file plus a small JSON sidecar holding
+    the remote URL. Entries are evicted least recently used first once the
+    assets take up more than max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def fetch(self, key, dest_path):
+        """Copy the cached asset for key to dest_path and return its URL.
+
+        Returns None on a miss.
+        """
+        meta_path = self._meta_path(key)
+        with self._lock:
+            try:
+                with open(meta_path, "r") as f:
+                    meta = json.load(f)
+                asset_path = os.path.join(self.cache_dir, meta["file"])
+                shutil.copyfile(asset_path, dest_path)
+                # Touch the entry so LRU eviction keeps it around
+                os.utime(meta_path, None)
+                self.hits += 1
+                return meta["url"]
+            except (OSError, KeyError, json.JSONDecodeError):
+                self.misses += 1
+                return None
+
+    def put(self, key, url, source_path):
+        """Store a copy of source_path and its remote URL under key."""
+        ext = os.path.splitext(source_path)[1]
+        asset_name = f"{key}{ext}"
+        meta_path = self._meta_path(key)
+        with self._lock:
+            tmp_asset = os.path.join(self.cache_dir, f"{asset_name}.tmp")
+            shutil.copyfile(source_path, tmp_asset)
+            os.replace(tmp_asset, os.path.join(self.cache_dir, asset_name))
+            tmp_meta = f"{meta_path}.tmp"
+            with open(tmp_meta, "w") as f:
+                json.dump({"url": url, "file": asset_name}, f)
+            os.replace(tmp_meta, meta_path)
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.cache_dir, name)
+            try:
+                with open(meta_path, "r") as f:
+                    asset_path = os.path.join(self.cache_dir, json.load(f)["file"])
+                size = os.path.getsize(asset_path)
+                last_used = os.path.getmtime(meta_path)
+            except (OSError, KeyError, json.JSONDecodeError):
+                continue
+            entries.append((last_used, size, meta_path, asset_path))
+            total += size
+
+        entries.sort()
+        for _, size, meta_path, asset_path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(meta_path)
+            os.remove(asset_path)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
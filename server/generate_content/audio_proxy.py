@@ -0,0 +1,60 @@
+import os
+import tempfile
+import subprocess
+
+
+# Speech-grade settings are plenty for the model to hear tempo, mood and
+# lyrics, and make the upload a small fraction of a WAV master's size
+PROXY_SAMPLE_RATE = 16000
+PROXY_BITRATE = "48k"
+PROXY_EXTENSION = ".mp3"
+
+
+def create_analysis_proxy(song_path, proxy_folder, audio_hash):
+    """Return a compact mono MP3 of the song for model upload.
+
+    ffmpeg streams the source, so memory use does not grow with the track
+    length. Proxies are cached by the audio's content hash. If transcoding
+    fails the original file is returned so analysis can still proceed.
+    """
+    os.makedirs(proxy_folder, exist_ok=True)
+    proxy_path = os.path.join(proxy_folder, f"{audio_hash}{PROXY_EXTENSION}")
+    if os.path.exists(proxy_path):
+        return proxy_path
+
+    # A unique temp file per call, since two threads may transcode the
+    # same song at once
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f"{audio_hash}.", suffix=f".tmp{PROXY_EXTENSION}", dir=proxy_folder
+    )
+    os.close(fd)
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        str(song_path),
+        "-vn",
+        "-ac",
+        "1",
+        "-ar",
+        str(PROXY_SAMPLE_RATE),
+        "-c:a",
+        "libmp3lame",
+        "-b:a",
+        PROXY_BITRATE,
+        tmp_path,
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        os.replace(tmp_path, proxy_path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Could not create analysis proxy, uploading original: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return song_path
+
+    print(
+        f"Analysis proxy is {os.path.getsize(proxy_path) / 1024:.0f} KB "
+        f"(original {os.path.getsize(song_path) / 1024:.0f} KB)"
+    )
+    return proxy_path
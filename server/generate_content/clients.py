@@ -0,0 +1,53 @@
+import os
+import threading
+
+
+# Provider SDKs are imported on first use so the server starts without
+# paying for them, and each client is built once and shared by every
+# request and job (both SDKs' clients are safe to use from many threads)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+    return client
+
+
+def get_gemini_client():
+    """Return the shared Gemini client."""
+    def create():
+        from google import genai
+
+        return genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+
+    return _get_or_create("gemini", create)
+
+
+def luma_is_fake():
+    """Whether LUMA_FAKE selects the local stand-in for the Luma API."""
+    return os.environ.get("LUMA_FAKE", "").lower() in ("1", "true", "yes")
+
+
+def get_luma_client():
+    """Return the shared Luma client.
+
+    Set LUMA_FAKE=1 to use the local stand-in instead of the real API.
+    """
+    def create():
+        if luma_is_fake():
+            from .fake_luma import FakeLumaClient
+
+            return FakeLumaClient()
+
+        from lumaai import LumaAI
+
+        return LumaAI()
+
+    return _get_or_create("luma", create)
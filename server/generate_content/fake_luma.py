@@ -0,0 +1,129 @@
+import os
+import time
+import uuid
+import pathlib
+import threading
+import types
+
+
+# Real, local assets, so a render with the fake client downloads and
+# stitches actual files
+ASSETS_FOLDER = os.path.join(os.path.dirname(__file__), "..", "..", "assets")
+FAKE_IMAGE_URL = pathlib.Path(
+    ASSETS_FOLDER, "fake_luma", "keyframe.jpg"
+).resolve().as_uri()
+FAKE_VIDEO_URL = pathlib.Path(
+    ASSETS_FOLDER, "videos", "video_1.mp4"
+).resolve().as_uri()
+
+
+class _FakeGenerations:
+    def __init__(self, provider, kind):
+        self._provider = provider
+        self._kind = kind
+
+    def create(self, prompt=None, callback_url=None, **kwargs):
+        return self._provider._create(self._kind, prompt, callback_url)
+
+
+class FakeLumaClient:
+    """Local stand-in for the Luma client, for trying the pipeline offline.
+
+    Generations complete after `duration` seconds (or fail, if their prompt
+    contains `fail_marker`), with file:// URLs of fixture assets in the
+    repo. When created with a callback_url, the finished
+    generation is POSTed there like Luma's own callbacks; pass `deliver` to
+    hand callbacks to a function instead of over HTTP. Set drop_callbacks
+    to exercise the polling fallback.
+    """
+
+    def __init__(
+        self,
+        duration=2.0,
+        image_url=FAKE_IMAGE_URL,
+        video_url=FAKE_VIDEO_URL,
+        fail_marker="[fail]",
+        deliver=None,
+        drop_callbacks=False,
+    ):
+        self.duration = duration
+        self.image_url = image_url
+        self.video_url = video_url
+        self.fail_marker = fail_marker
+        self.deliver = deliver
+        self.drop_callbacks = drop_callbacks
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.get_calls = 0
+        self.generations = _FakeGenerations(self, "video")
+        self.generations.image = _FakeGenerations(self, "image")
+        self.generations.get = self._get
+        self.generations.delete = self._delete
+
+    def _create(self, kind, prompt, callback_url):
+        generation_id = str(uuid.uuid4())
+        with self._lock:
+            self._generations[generation_id] = {
+                "kind": kind,
+                "prompt": prompt or "",
+                "created_at": time.monotonic(),
+            }
+        if callback_url and not self.drop_callbacks:
+            timer = threading.Timer(
+                self.duration, self._callback, (generation_id, callback_url)
+            )
+            timer.daemon = True
+            timer.start()
+        return types.SimpleNamespace(id=generation_id, state="queued")
+
+    def _payload(self, generation_id):
+        with self._lock:
+            generation = self._generations.get(generation_id)
+        if generation is None:
+            raise KeyError(f"Generation {generation_id} not found")
+        payload = {"id": generation_id, "state": "dreaming", "assets": None}
+        if time.monotonic() - generation["created_at"] >= self.duration:
+            if self.fail_marker in generation["prompt"]:
+                payload["state"] = "failed"
+                payload["failure_reason"] = "Fake failure"
+            else:
+                payload["state"] = "completed"
+                payload["assets"] = {
+                    generation["kind"]: (
+                        self.image_url
+                        if generation["kind"] == "image"
+                        else self.video_url
+                    )
+                }
+        return payload
+
+    def _get(self, id):
+        with self._lock:
+            self.get_calls += 1
+        payload = self._payload(id)
+        assets = payload["assets"]
+        return types.SimpleNamespace(
+            **{
+                **payload,
+                "assets": types.SimpleNamespace(**assets) if assets else None,
+            }
+        )
+
+    def _delete(self, id):
+        with self._lock:
+            self._generations.pop(id, None)
+
+    def _callback(self, generation_id, callback_url):
+        try:
+            payload = self._payload(generation_id)
+        except KeyError:
+            return
+        if self.deliver is not None:
+            self.deliver(payload)
+            return
+        import requests
+
+        try:
+            requests.post(callback_url, json=payload, timeout=10)
+        except requests.RequestException as e:
+            print(f"Fake callback for {generation_id} failed: {str(e)}")
@@ -1,10 +1,16 @@
-import re
 import json
 
 from typing import List
-from google.genai import types
 from pydantic import ValidationError, BaseModel, Field
 from .prompts import SONG_DESC_SYSTEM_PROMPT, SONG_DESC_USER_PROMPT
+from .audio_proxy import create_analysis_proxy
+from .json_repair import repair_json
+from .scene_stream import SceneStreamParser
+from .analysis_cache import analysis_cache_key, file_sha256
+
+ANALYSIS_MODEL = 'gemini-2.0-flash'
+# Part of the analysis cache key; bump when the models below change
+ANALYSIS_SCHEMA_VERSION = 1
 
 
 class SongAnalysis(BaseModel):
@@ -29,41 +35,145 @@ class MusicVideoScenes(BaseModel):
     scenes: List[Scene]
 
 
-def generate_music_video_analysis(song_path: str, client, song_title=None, song_artist=None, ) -> MusicVideoScenes:
+def parse_music_video_response(response_text):
+    """Validate a model response, repairing it before giving up.
+
+    Returns (MusicVideoScenes, data). Raises JSONDecodeError or
+    ValidationError if even the repaired text is unusable.
+    """
+    try:
+        music_video_data = json.loads(response_text)
+        return MusicVideoScenes(**music_video_data), music_video_data
+    except (json.JSONDecodeError, ValidationError, TypeError) as e:
+        print("Response is not valid as-is, attempting repair:", e)
+
+    music_video_data = json.loads(repair_json(response_text))
+    return MusicVideoScenes(**music_video_data), music_video_data
+
+
+def stream_scenes(client, config, contents, on_scene):
+    """Stream the model response, handing each scene to on_scene early.
+
+    Streaming stops at the first scene that does not validate, so later
+    scenes keep their positions and come from the final response instead.
+    Returns the full response text once the stream ends.
+    """
+    parser = SceneStreamParser()
+    chunks = []
+    for chunk in client.models.generate_content_stream(
+            model=ANALYSIS_MODEL, config=config, contents=contents):
+        text = chunk.text or ""
+        chunks.append(text)
+        for scene_data in parser.feed(text):
+            try:
+                scene = Scene(**scene_data)
+            except ValidationError as e:
+                print("Stopping scene stream at invalid scene:", e)
+                parser.stop()
+                break
+            print(f"Scene {scene.scene_number} ready while streaming")
+            on_scene(scene)
+    return "".join(chunks)
+
+
+def generate_music_video_analysis(song_path: str, client, song_title=None, song_artist=None, cache=None, proxy_folder=None, on_scene=None, max_attempts=2) -> MusicVideoScenes:
+    """Analyze a song into a storyboard of scenes.
+
+    If on_scene is given the response is streamed, and on_scene(scene) is
+    called with each validated Scene as soon as it is complete. Malformed
+    responses are repaired locally first; the model is only asked again
+    (up to max_attempts calls in total) when repair fails. A result that
+    does not start with the scenes already streamed is rejected, so
+    callers never mix scenes from two storyboards.
+    """
 
     system_instructions = SONG_DESC_SYSTEM_PROMPT
     user_prompt = SONG_DESC_USER_PROMPT
 
     print("song_path", song_path)
 
-    myfile = client.files.upload(file=song_path)
-
-    response = client.models.generate_content(
-        model='gemini-2.0-flash',
-        config=types.GenerateContentConfig(
-            system_instruction=system_instructions),
-        contents=[user_prompt, myfile]
-    )
-
-    json_str = response.text
-
-    try:
-        # Check if the response contains markdown code blocks
-        json_match = re.search(r'```json\s*(.*?)\s*```',
-                               response.text, re.DOTALL)
-
-        if json_match:
-            # Extract just the JSON without the markdown code block tags
-            json_str = json_match.group(1)
+    audio_hash = None
+    if cache is not None or proxy_folder is not None:
+        audio_hash = file_sha256(song_path)
+
+    cache_key = None
+    if cache is not None:
+        cache_key = analysis_cache_key(
+            audio_hash, ANALYSIS_MODEL,
+            system_instructions, user_prompt,
+            schema_version=ANALYSIS_SCHEMA_VERSION)
+        cached = cache.get(cache_key)
+        music_video_scenes = None
+        if cached is not None:
+            try:
+                music_video_scenes = MusicVideoScenes(**cached)
+            except (ValidationError, TypeError) as e:
+                # Written for an older schema; analyze again
+                print("Ignoring cached song analysis:", e)
+        if music_video_scenes is not None:
+            print("Using cached song analysis")
+            if on_scene is not None:
+                for scene in music_video_scenes.scenes:
+                    on_scene(scene)
+            return music_video_scenes
+
+    # Upload a small mono proxy instead of the full quality master
+    upload_path = song_path
+    if proxy_folder is not None:
+        upload_path = create_analysis_proxy(
+            song_path, proxy_folder, audio_hash)
+
+    myfile = client.files.upload(file=upload_path)
+
+    # Imported lazily to keep the SDK off the server's startup path
+    from google.genai import types
+
+    # Constrain the model to the storyboard schema instead of relying on
+    # the prompt's JSON template alone
+    config = types.GenerateContentConfig(
+        system_instruction=system_instructions,
+        response_mime_type='application/json',
+        response_schema=MusicVideoScenes)
+
+    streamed = []
+
+    def stream_scene(scene):
+        streamed.append(scene)
+        on_scene(scene)
+
+    for attempt in range(max_attempts):
+        # Scenes are only streamed once so callers never see duplicates
+        if on_scene is None or attempt > 0:
+            response = client.models.generate_content(
+                model=ANALYSIS_MODEL,
+                config=config,
+                contents=[user_prompt, myfile]
+            )
+            response_text = response.text
         else:
-            # If no markdown code blocks, use the full response
-            json_str = response.text
-
-        # Parse the JSON string
-        music_video_data = json.loads(json_str)
-
-        # Create a MusicVideoScenes instance
-        music_video_scenes = MusicVideoScenes(**music_video_data)
+            response_text = stream_scenes(
+                client, config, [user_prompt, myfile], stream_scene)
+
+        try:
+            music_video_scenes, music_video_data = parse_music_video_response(
+                response_text)
+        except json.JSONDecodeError as e:
+            print("Error parsing JSON response:", e)
+            print("Raw response:", response_text)
+            continue
+        except ValidationError as e:
+            print("Pydantic validation error:", e)
+            print("Raw response:", response_text)
+            continue
+
+        # A re-query writes a new storyboard, which only fits after the
+        # streamed scenes if it begins with exactly those scenes
+        head = music_video_scenes.scenes[:len(streamed)]
+        if [scene.model_dump() for scene in head] != [
+                scene.model_dump() for scene in streamed]:
+            print(f"Response does not match the {len(streamed)} scenes "
+                  "already streamed; giving up on song analysis")
+            return None
 
         print("Successfully parsed response into MusicVideoScenes object!")
         print(f"Number of scenes: {len(music_video_scenes.scenes)}")
@@ -71,17 +181,10 @@ def generate_music_video_analysis(song_path: str, client, song_title=None, song_
         # You can also save the entire structured data
         with open('music_video_storyboard.json', 'w') as f:
             json.dump(music_video_data, f, indent=2)
+
+        if cache_key is not None:
+            cache.put(cache_key, music_video_data)
         return music_video_scenes
 
-    except json.JSONDecodeError as e:
-        print("Error parsing JSON response:", e)
-        print("Raw response:", response.text)
-        return None
-    except ValidationError as e:
-        print("Pydantic validation error:", e)
-        print("JSON data received:", music_video_data)
-        return None
-    except Exception as e:
-        print("Error creating MusicVideoScenes object:", e)
-        print("Exception:", str(e))
-        return None
+    print(f"Giving up on song analysis after {max_attempts} attempts")
+    return None
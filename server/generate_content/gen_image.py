@@ -1,28 +1,30 @@
-import time
+from .generation_poller import get_generation_poller
 
+IMAGE_MODEL = "photon-1"
+DRAFT_IMAGE_MODEL = "photon-flash-1"
 
-def test_image_generation(client, prompt, aspect_ratio="9:16"):
-    """Test image generation and return the image URL"""
+
+def test_image_generation(client, prompt, aspect_ratio="9:16", poller=None, on_created=None, model=IMAGE_MODEL):
+    """Test image generation and return the image URL
+
+    on_created(generation_id) is called as soon as the generation exists.
+    """
     print("Starting image generation test...")
+    poller = poller or get_generation_poller()
 
     # Create an image generation
     generation = client.generations.image.create(
         prompt=prompt,
         aspect_ratio=aspect_ratio,
-        model="photon-1"
+        model=model,
+        **poller.create_options()
     )
 
-    # Poll for completion
-    completed = False
-    while not completed:
-        generation = client.generations.get(id=generation.id)
-        if generation.state == "completed":
-            completed = True
-        elif generation.state == "failed":
-            raise RuntimeError(
-                f"Generation failed: {generation.failure_reason}")
-        print("Generating image...")
-        time.sleep(2)
+    if on_created:
+        on_created(generation.id)
+
+    # Wait for the shared poller to report completion
+    generation = poller.watch(client, generation.id, model).result()
 
     print(f"Image generation completed! URL: {generation.assets.image}")
     return generation.assets.image
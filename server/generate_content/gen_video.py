@@ -1,30 +1,51 @@
-import time
+from .generation_poller import get_generation_poller
 
+VIDEO_MODEL = "ray-flash-2"
+FINAL_VIDEO_MODEL = "ray-2"
+VIDEO_DURATION = "5s"
 
-def video_generation(client, prompt, image_url, aspect_ratio="9:16"):
-    """Generate video using the provided image and aspect ratio"""
-    print(f"\nStarting video generation with aspect ratio: {aspect_ratio}")
 
+def start_video_generation(client, prompt, image_url, aspect_ratio, poller, model=VIDEO_MODEL, resolution=None):
+    """Create a video generation and return (id, future of its completion)"""
+    options = poller.create_options()
+    if resolution:
+        options["resolution"] = resolution
     generation = client.generations.create(
         prompt=prompt,
-        model="ray-flash-2",
-        duration="5s",
+        model=model,
+        duration=VIDEO_DURATION,
         aspect_ratio=aspect_ratio,
         keyframes={"frame0": {"type": "image", "url": image_url}},
+        **options,
     )
+    return generation.id, poller.watch(client, generation.id, model)
+
+
+def video_generation(client, prompt, image_url, aspect_ratio="9:16", poller=None, hedge=None, on_created=None, model=VIDEO_MODEL, resolution=None):
+    """Generate video using the provided image and aspect ratio
+
+    on_created(generation_id) is called for every generation started,
+    including hedges. resolution (such as "540p") is left to the provider's
+    default when not given.
+    """
+    print(f"\nStarting video generation with aspect ratio: {aspect_ratio}")
+    poller = poller or get_generation_poller()
+
+    def start():
+        generation_id, future = start_video_generation(
+            client, prompt, image_url, aspect_ratio, poller, model, resolution
+        )
+        if on_created:
+            on_created(generation_id)
+        return generation_id, future
 
-    # Poll for completion
-    completed = False
-    while not completed:
-        generation = client.generations.get(id=generation.id)
-        if generation.state == "completed":
-            completed = True
-        elif generation.state == "failed":
-            raise RuntimeError(
-                f"Generation failed: {generation.failure_reason}"
-            )
-        print(f"Generating video with aspect ratio {aspect_ratio}...")
-        time.sleep(2)
+    # Wait for the shared poller to report completion, hedging stragglers
+    # if the job allows it
+    if hedge is None:
+        _, future = start()
+        generation = future.result()
+    else:
+        generation = hedge.run(start, model, poller, client)
 
     print(f"Video generation completed! URL: {generation.assets.video}")
     return generation.assets.video
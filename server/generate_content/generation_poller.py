@@ -0,0 +1,309 @@
+import time
+import types
+import heapq
+import itertools
+import threading
+import collections
+import concurrent.futures
+
+
+# Rough time (seconds) each Luma model takes to finish a generation. These
+# seed the per-model estimate, which is then refined from observed runs.
+DEFAULT_EXPECTED_DURATIONS = {
+    "photon-1": 15.0,
+    "photon-flash-1": 8.0,
+    "ray-flash-2": 45.0,
+    "ray-2": 120.0,
+}
+FALLBACK_EXPECTED_DURATION = 60.0
+
+MIN_POLL_INTERVAL = 1.0
+MAX_POLL_INTERVAL = 15.0
+
+# Completed generations remembered per model for latency percentiles
+LATENCY_HISTORY_SIZE = 100
+
+# With completion callbacks on, polling is only a fallback for callbacks
+# that never arrive, so the first check waits this multiple of the
+# model's expected duration
+CALLBACK_FALLBACK_FACTOR = 2.0
+
+# A generation is given up on after this many status checks fail in a
+# row, at once on a client error (404, auth), or once it has been watched
+# for longer than MAX_WATCH_AGE seconds
+MAX_POLL_ERRORS = 5
+MAX_WATCH_AGE = 30 * 60
+
+
+class _Watch:
+    def __init__(self, client, generation_id, model, future, on_progress, max_age):
+        self.client = client
+        self.generation_id = generation_id
+        self.model = model
+        self.future = future
+        self.on_progress = on_progress
+        self.max_age = max_age
+        self.started_at = time.monotonic()
+        self.polls = 0
+        self.errors = 0
+
+
+class GenerationPoller:
+    """Track every in-flight Luma generation from a single scheduler thread.
+
+    Callers register a generation ID with watch() and get back a Future that
+    resolves to the completed generation (or raises if it failed). Status
+    checks are scheduled per generation: the first check waits for most of
+    the model's expected duration, later checks close in on it and then back
+    off the longer a generation runs over, so hundreds of pending
+    generations need only a handful of threads.
+
+    With enable_callbacks(), generations are created with a callback URL
+    and complete() resolves them as soon as Luma reports back; polling then
+    only catches callbacks that went missing.
+    """
+
+    def __init__(self, poll_workers=4, smoothing=0.2, expected_durations=None):
+        self.smoothing = smoothing
+        self._expected = dict(DEFAULT_EXPECTED_DURATIONS)
+        self._expected.update(expected_durations or {})
+        self._latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=LATENCY_HISTORY_SIZE)
+        )
+        self._heap = []
+        self._counter = itertools.count()
+        self._watches = {}
+        self._cond = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=poll_workers, thread_name_prefix="luma-poll"
+        )
+        self._thread = None
+        self.callback_url = None
+        self.status_calls = 0
+        self.callbacks = 0
+
+    def enable_callbacks(self, callback_url):
+        """Have new generations report completion to callback_url."""
+        self.callback_url = callback_url
+
+    def create_options(self):
+        """Extra arguments for generation create() calls."""
+        if self.callback_url:
+            return {"callback_url": self.callback_url}
+        return {}
+
+    def complete(self, generation):
+        """Resolve a watched generation from a callback.
+
+        Returns True if it finished a watched generation. Progress updates
+        and unknown or already finished generations are ignored.
+        """
+        with self._cond:
+            entry = self._watches.get(generation.id)
+        if entry is None:
+            return False
+        if generation.state not in ("completed", "failed"):
+            if entry.on_progress:
+                entry.on_progress(generation)
+            return False
+        with self._cond:
+            self.callbacks += 1
+        self._handle_status(entry, generation)
+        return True
+
+    def watch(
+        self, client, generation_id, model, on_progress=None, max_age=MAX_WATCH_AGE
+    ):
+        """Return a Future for the generation, polling it in the background.
+
+        The future fails with TimeoutError if the generation has not
+        finished within max_age seconds.
+        """
+        future = concurrent.futures.Future()
+        entry = _Watch(client, generation_id, model, future, on_progress, max_age)
+        with self._cond:
+            self._watches[generation_id] = entry
+            self._schedule(entry, self._first_delay(model))
+            self._ensure_thread()
+            self._cond.notify()
+        return future
+
+    def unwatch(self, generation_id):
+        """Stop tracking a generation and cancel its future."""
+        with self._cond:
+            entry = self._watches.pop(generation_id, None)
+        if entry is not None and entry.future.cancel():
+            # Wake anything blocked in concurrent.futures.wait() on it
+            entry.future.set_running_or_notify_cancel()
+
+    def latency_percentile(self, model, percentile, min_samples=5):
+        """Return the given percentile (0-1) of recent completion times.
+
+        Returns None until enough generations of the model have finished.
+        """
+        with self._cond:
+            latencies = sorted(self._latencies[model])
+        if len(latencies) < min_samples:
+            return None
+        index = min(len(latencies) - 1, int(percentile * len(latencies)))
+        return latencies[index]
+
+    def expected_duration(self, model):
+        with self._cond:
+            return self._expected.get(model, FALLBACK_EXPECTED_DURATION)
+
+    def pending(self):
+        with self._cond:
+            return len(self._watches)
+
+    def _first_delay(self, model):
+        factor = CALLBACK_FALLBACK_FACTOR if self.callback_url else 0.6
+        return max(
+            MIN_POLL_INTERVAL,
+            self._expected.get(model, FALLBACK_EXPECTED_DURATION) * factor,
+        )
+
+    def _next_delay(self, entry):
+        expected = self._expected.get(entry.model, FALLBACK_EXPECTED_DURATION)
+        elapsed = time.monotonic() - entry.started_at
+        if elapsed < expected:
+            # Close to the typical finish time: check a few times around it
+            delay = (expected - elapsed) / 2
+        else:
+            # Running long: back off in proportion to how overdue it is
+            delay = (elapsed - expected) / 2
+        return min(MAX_POLL_INTERVAL, max(MIN_POLL_INTERVAL, delay))
+
+    def _schedule(self, entry, delay):
+        heapq.heappush(
+            self._heap,
+            (time.monotonic() + delay, next(self._counter), entry.generation_id),
+        )
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="luma-poller", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due_at, _, generation_id = self._heap[0]
+                wait = due_at - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(timeout=wait)
+                    continue
+                heapq.heappop(self._heap)
+                entry = self._watches.get(generation_id)
+            if entry is not None:
+                self._executor.submit(self._poll, entry)
+
+    def _poll(self, entry):
+        try:
+            generation = entry.client.generations.get(id=entry.generation_id)
+        except Exception as e:
+            print(f"Error polling generation {entry.generation_id}: {str(e)}")
+            entry.polls += 1
+            entry.errors += 1
+            status = getattr(e, "status_code", None)
+            # Client errors other than rate limiting will not go away
+            if status is not None and 400 <= status < 500 and status != 429:
+                self._fail(entry, e)
+            elif entry.errors >= MAX_POLL_ERRORS:
+                self._fail(
+                    entry,
+                    RuntimeError(
+                        f"Gave up on generation {entry.generation_id} after "
+                        f"{entry.errors} failed status checks: {str(e)}"
+                    ),
+                )
+            else:
+                self._reschedule(entry)
+            return
+        entry.errors = 0
+        with self._cond:
+            self.status_calls += 1
+        self._handle_status(entry, generation)
+
+    def _handle_status(self, entry, generation):
+        if generation.state == "completed":
+            if not self._finish(entry):
+                return
+            self._record_duration(entry)
+            entry.future.set_result(generation)
+        elif generation.state == "failed":
+            # Read before _finish drops the watch: callback payloads may
+            # leave the field out, and an error past that point would
+            # leave the future unresolved with nothing left to poll it
+            reason = getattr(generation, "failure_reason", None)
+            if not self._finish(entry):
+                return
+            entry.future.set_exception(
+                RuntimeError(f"Generation failed: {reason}")
+            )
+        else:
+            entry.polls += 1
+            if entry.on_progress:
+                entry.on_progress(generation)
+            self._reschedule(entry)
+
+    def _reschedule(self, entry):
+        if time.monotonic() - entry.started_at > entry.max_age:
+            self._fail(
+                entry,
+                TimeoutError(
+                    f"Generation {entry.generation_id} did not finish "
+                    f"within {entry.max_age:.0f}s"
+                ),
+            )
+            return
+        with self._cond:
+            if entry.generation_id in self._watches:
+                self._schedule(entry, self._next_delay(entry))
+                self._cond.notify()
+
+    def _fail(self, entry, error):
+        if self._finish(entry):
+            entry.future.set_exception(error)
+
+    def _finish(self, entry):
+        with self._cond:
+            # Only the first completion wins; late duplicates are ignored
+            return self._watches.pop(entry.generation_id, None) is not None
+
+    def _record_duration(self, entry):
+        elapsed = time.monotonic() - entry.started_at
+        with self._cond:
+            self._latencies[entry.model].append(elapsed)
+            previous = self._expected.get(entry.model, elapsed)
+            self._expected[entry.model] = (
+                1 - self.smoothing
+            ) * previous + self.smoothing * elapsed
+
+
+def generation_from_payload(payload):
+    """Turn a callback's JSON body into an object shaped like the SDK's."""
+    if isinstance(payload, dict):
+        return types.SimpleNamespace(
+            **{key: generation_from_payload(value) for key, value in payload.items()}
+        )
+    if isinstance(payload, list):
+        return [generation_from_payload(value) for value in payload]
+    return payload
+
+
+_shared_poller = None
+_shared_poller_lock = threading.Lock()
+
+
+def get_generation_poller():
+    """Return the process-wide poller shared by all image/video generations."""
+    global _shared_poller
+    with _shared_poller_lock:
+        if _shared_poller is None:
+            _shared_poller = GenerationPoller()
+        return _shared_poller
@@ -0,0 +1,124 @@
+import threading
+import concurrent.futures
+
+
+class HedgePolicy:
+    """Duplicate straggling generations, within a per-job budget.
+
+    When a generation is still running after the chosen percentile of
+    recent latencies for its model, a second identical generation is
+    started and whichever finishes first wins. The loser is cancelled.
+    A job may fire at most `budget` hedges in total.
+
+    With a governor, each hedge also needs a free slot from the provider's
+    limiter (see AdaptiveLimiter.try_acquire()); when none is free the
+    generation is not hedged, so hedges never push past the rate and
+    concurrency limits.
+    """
+
+    def __init__(
+        self,
+        percentile=0.9,
+        budget=2,
+        fallback_factor=2.0,
+        governor=None,
+        provider="luma",
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.fallback_factor = fallback_factor
+        self.governor = governor
+        self.provider = provider
+        self.fired = 0
+        self._lock = threading.Lock()
+
+    def _take(self):
+        with self._lock:
+            if self.fired >= self.budget:
+                return False
+            self.fired += 1
+            return True
+
+    def _refund(self):
+        with self._lock:
+            self.fired -= 1
+
+    def _error_outcome(self, error):
+        if self.governor is None:
+            return "error"
+        return self.governor.error_outcome(error)
+
+    def hedge_after(self, poller, model):
+        """Seconds to wait before hedging a generation of model."""
+        threshold = poller.latency_percentile(model, self.percentile)
+        if threshold is None:
+            # Not enough history yet: be conservative
+            threshold = poller.expected_duration(model) * self.fallback_factor
+        return threshold
+
+    def run(self, start, model, poller, client):
+        """Run start() -> (generation_id, future), hedging if it straggles.
+
+        Returns the completed generation.
+        """
+        first_id, first = start()
+        try:
+            return first.result(timeout=self.hedge_after(poller, model))
+        except concurrent.futures.TimeoutError:
+            pass
+        if not self._take():
+            return first.result()
+        limiter = None
+        if self.governor is not None:
+            limiter = self.governor.limiter(self.provider, model)
+            if not limiter.try_acquire():
+                print(f"No {self.provider} capacity free to hedge {first_id}")
+                self._refund()
+                return first.result()
+
+        print(f"Generation {first_id} is straggling, starting a hedge")
+        outcome = "cancelled"
+        try:
+            try:
+                second_id, second = start()
+            except Exception as e:
+                print(f"Could not start a hedge for {first_id}: {str(e)}")
+                outcome = self._error_outcome(e)
+                return first.result()
+            attempts = {first: first_id, second: second_id}
+            pending = set(attempts)
+            error = None
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    if future.exception() is not None:
+                        error = future.exception()
+                        if future is second:
+                            outcome = self._error_outcome(error)
+                        continue
+                    for other in pending:
+                        cancel_generation(client, poller, attempts[other])
+                    if future is second:
+                        outcome = "success"
+                    return future.result()
+            if error is None:
+                raise concurrent.futures.CancelledError(
+                    f"Generation {first_id} and its hedge were both cancelled"
+                )
+            raise error
+        finally:
+            if limiter is not None:
+                limiter.release(outcome)
+
+
+def cancel_generation(client, poller, generation_id):
+    """Stop waiting for a generation and ask Luma to drop it."""
+    poller.unwatch(generation_id)
+    try:
+        client.generations.delete(id=generation_id)
+    except Exception as e:
+        print(f"Could not cancel generation {generation_id}: {str(e)}")
@@ -0,0 +1,72 @@
+import re
+
+
+def repair_json(text):
+    """Best-effort cleanup of almost-JSON model output.
+
+    Handles the defects we actually see: markdown fences, prose around the
+    object, // comments copied from the prompt template, trailing commas
+    and output truncated mid-string or mid-object.
+    """
+    fence = re.search(r"```(?:json)?\s*(.*?)\s*(```|$)", text, re.DOTALL)
+    if fence:
+        text = fence.group(1)
+
+    start = text.find("{")
+    if start == -1:
+        return text
+    end = text.rfind("}")
+    text = text[start : end + 1] if end > start else text[start:]
+
+    out = []
+    stack = []
+    in_string = False
+    escape = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char == "\n":
+                # Raw newlines are not allowed inside JSON strings
+                out[-1] = "\\n"
+            i += 1
+            continue
+
+        if char == "/" and text[i + 1 : i + 2] == "/":
+            newline = text.find("\n", i)
+            i = len(text) if newline == -1 else newline
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            _strip_trailing_comma(out)
+            if stack:
+                stack.pop()
+        out.append(char)
+        i += 1
+
+    # Close whatever a truncated response left open
+    if in_string:
+        out.append('"')
+    _strip_trailing_comma(out)
+    while stack:
+        out.append(stack.pop())
+        _strip_trailing_comma(out)
+    return "".join(out)
+
+
+def _strip_trailing_comma(out):
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j]
@@ -0,0 +1,108 @@
+import json
+
+from .json_repair import repair_json
+
+
+class SceneStreamParser:
+    """Incrementally pick complete scene objects out of a streamed response.
+
+    Text is fed in arbitrary chunks as the model writes it. The parser tracks
+    strings, escapes and nesting so it can tell when an object directly
+    inside the top level "scenes" array has closed, and returns each such
+    object as soon as it is complete. Anything before the first "{" (such
+    as a ```json fence) is ignored. A scene that cannot be parsed even
+    after repair_json ends the stream, since every later scene would be
+    handed out under the wrong index; callers take the rest of the scenes
+    from the final response instead.
+    """
+
+    def __init__(self, array_key="scenes"):
+        self.array_key = array_key
+        self._buffer = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._pending_key = None
+        self._object_start = None
+        self._done = False
+
+    def feed(self, text):
+        """Add text and return the list of scene dicts it completed."""
+        self._buffer += text
+        completed = []
+        while self._pos < len(self._buffer) and not self._done:
+            i = self._pos
+            char = self._buffer[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = self._buffer[self._string_start + 1 : i]
+                continue
+
+            if not self._stack and char != "{":
+                # Skip fences or prose before the root object
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":":
+                self._pending_key = self._last_string
+            elif char in "{[":
+                self._stack.append((char, self._pending_key))
+                self._pending_key = None
+                if char == "{" and self._in_scenes_array(len(self._stack) - 1):
+                    self._object_start = i
+            elif char in "}]":
+                self._stack.pop()
+                self._pending_key = None
+                closes_scene = (
+                    char == "}"
+                    and self._object_start is not None
+                    and self._in_scenes_array(len(self._stack))
+                )
+                if closes_scene:
+                    scene_text = self._buffer[self._object_start : i + 1]
+                    self._object_start = None
+                    scene = self._parse_scene(scene_text)
+                    if scene is None:
+                        self.stop()
+                        break
+                    completed.append(scene)
+                if not self._stack:
+                    self._done = True
+            elif char == ",":
+                self._pending_key = None
+        return completed
+
+    def stop(self):
+        """Hand out no further scenes."""
+        self._done = True
+
+    def _parse_scene(self, scene_text):
+        try:
+            return json.loads(scene_text)
+        except json.JSONDecodeError:
+            pass
+        try:
+            return json.loads(repair_json(scene_text))
+        except json.JSONDecodeError as e:
+            print(f"Stopping scene stream at unparsable scene: {e}")
+            return None
+
+    def _in_scenes_array(self, depth):
+        """Check whether the first depth stack entries are root -> scenes."""
+        return (
+            depth == 2
+            and self._stack[0][0] == "{"
+            and self._stack[1] == ("[", self.array_key)
+        )
@@ -0,0 +1,723 @@
+import os
+import time
+import shutil
+import functools
+import threading
+import collections
+import concurrent.futures
+
+from utils.download import download_file
+from utils.governor import get_governor
+from utils.checkpoints import RenderCheckpoint
+from utils.hls import ProgressivePlaylist
+from utils.renditions import export_renditions
+from utils.stitch_videos import (
+    get_video_files_from_directory,
+    regrade_video,
+    stitch_with_intermediates,
+    x264_args,
+)
+from generate_content.asset_cache import generation_cache_key
+from generate_content.clients import (
+    get_gemini_client,
+    get_luma_client,
+    luma_is_fake,
+)
+from generate_content.hedging import HedgePolicy
+from generate_content.generation_poller import get_generation_poller
+from generate_content.gen_video import (
+    FINAL_VIDEO_MODEL,
+    VIDEO_DURATION,
+    VIDEO_MODEL,
+    video_generation,
+)
+from generate_content.gen_image import (
+    DRAFT_IMAGE_MODEL,
+    IMAGE_MODEL,
+    test_image_generation,
+)
+from generate_content.gen_analysis import (
+    ANALYSIS_MODEL,
+    Scene,
+    generate_music_video_analysis,
+)
+
+
+# Models and encoder settings per render tier. Drafts are cheap to
+# generate and quick to encode, for exploring a storyboard; final renders
+# spend more, only on approved scenes, animating the draft images so
+# the compositions carry over.
+RENDER_TIERS = {
+    "draft": {
+        "image_model": DRAFT_IMAGE_MODEL,
+        "video_model": VIDEO_MODEL,
+        "resolution": "540p",
+        "encode": {"preset": "ultrafast", "crf": 28},
+        "keep_keyframes": False,
+    },
+    "standard": {
+        "image_model": IMAGE_MODEL,
+        "video_model": VIDEO_MODEL,
+        "resolution": None,
+        "encode": {"preset": "medium", "crf": 23},
+        "keep_keyframes": False,
+    },
+    "final": {
+        "image_model": IMAGE_MODEL,
+        "video_model": FINAL_VIDEO_MODEL,
+        "resolution": "720p",
+        "encode": {"preset": "slow", "crf": 20},
+        "keep_keyframes": True,
+    },
+}
+
+
+def video_generation_spec(model, resolution=None):
+    """Identify the model/resolution a clip was generated with."""
+    return f"{model}@{resolution or 'default'}"
+
+
+# Clips checkpointed before tiers existed were made this way
+DEFAULT_VIDEO_SPEC = video_generation_spec(VIDEO_MODEL)
+
+
+def submit_after(executor, future, fn):
+    """Submit fn(result) to executor once future succeeds.
+
+    Returns a future for fn's result. If the upstream future fails, its
+    exception is propagated without running fn.
+    """
+    chained = concurrent.futures.Future()
+
+    def forward(done):
+        if done.cancelled():
+            chained.cancel()
+        elif done.exception() is not None:
+            chained.set_exception(done.exception())
+        else:
+            chained.set_result(done.result())
+
+    def start(done):
+        if done.cancelled():
+            chained.cancel()
+        elif done.exception() is not None:
+            chained.set_exception(done.exception())
+        else:
+            try:
+                executor.submit(fn, done.result()).add_done_callback(forward)
+            except RuntimeError as e:
+                # The executor was shut down after an earlier failure
+                chained.set_exception(e)
+
+    future.add_done_callback(start)
+    return chained
+
+
+def fetch_cached_asset(asset_cache, cache_key, dest_path):
+    """Copy a cached asset to dest_path, returning its URL or None."""
+    if asset_cache is None:
+        return None
+    return asset_cache.fetch(cache_key, dest_path)
+
+
+class _SessionAnalysis:
+    """One session's analysis: its future plus the scenes streamed so far."""
+
+    def __init__(self):
+        self.future = None
+        self.scenes = []
+        self.cond = threading.Condition()
+
+    def add_scene(self, scene):
+        with self.cond:
+            self.scenes.append(scene)
+            self.cond.notify_all()
+
+    def notify_done(self, _future):
+        with self.cond:
+            self.cond.notify_all()
+
+
+class SongAnalyzer:
+    """Run song analyses in the background, at most one per session.
+
+    /upload can start an analysis speculatively; a later render for the
+    same session attaches to the in-flight or finished result instead of
+    starting over. With stream=True, scenes are made available through
+    iter_scenes() as soon as the model has written them.
+    """
+
+    def __init__(
+        self,
+        max_workers=2,
+        cache=None,
+        proxy_folder=None,
+        stream=True,
+        max_sessions=256,
+    ):
+        self.cache = cache
+        self.proxy_folder = proxy_folder
+        self.stream = stream
+        self.max_sessions = max_sessions
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="song-analysis"
+        )
+        self._analyses = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _analyze(self, analysis, session_id, audio_file_path):
+        music_video_scenes = get_governor().call(
+            "gemini",
+            ANALYSIS_MODEL,
+            generate_music_video_analysis,
+            audio_file_path,
+            get_gemini_client(),
+            cache=self.cache,
+            proxy_folder=self.proxy_folder,
+            on_scene=analysis.add_scene if self.stream else None,
+            job_id=session_id,
+        )
+        if music_video_scenes is None:
+            raise RuntimeError("Error generating music video scenes")
+        return music_video_scenes
+
+    def _start(self, session_id, audio_file_path):
+        with self._lock:
+            analysis = self._analyses.get(session_id)
+            # A failed speculative run is retried rather than reused
+            if analysis is None or (
+                analysis.future.done()
+                and analysis.future.exception() is not None
+            ):
+                analysis = _SessionAnalysis()
+                analysis.future = self._executor.submit(
+                    self._analyze, analysis, session_id, audio_file_path
+                )
+                analysis.future.add_done_callback(analysis.notify_done)
+                self._analyses[session_id] = analysis
+            self._analyses.move_to_end(session_id)
+            while len(self._analyses) > self.max_sessions:
+                self._analyses.popitem(last=False)
+            return analysis
+
+    def start(self, session_id, audio_file_path):
+        """Start analysing a session's song unless it is already underway."""
+        return self._start(session_id, audio_file_path).future
+
+    def status(self, session_id):
+        with self._lock:
+            analysis = self._analyses.get(session_id)
+        if analysis is None:
+            return None
+        if not analysis.future.done():
+            return "running"
+        if analysis.future.exception() is not None:
+            return "failed"
+        return "completed"
+
+    def result(self, session_id, audio_file_path):
+        """Wait for the session's analysis, starting it if needed."""
+        return self.start(session_id, audio_file_path).result()
+
+    def iter_scenes(self, session_id, audio_file_path):
+        """Yield the session's scenes in order as they become available.
+
+        Raises the analysis error if it fails.
+        """
+        analysis = self._start(session_id, audio_file_path)
+        yielded = 0
+        while True:
+            with analysis.cond:
+                while (
+                    yielded >= len(analysis.scenes)
+                    and not analysis.future.done()
+                ):
+                    analysis.cond.wait()
+                if yielded >= len(analysis.scenes):
+                    break
+                scene = analysis.scenes[yielded]
+            yielded += 1
+            yield scene
+
+        # Anything the stream could not pick out comes from the final result
+        for scene in analysis.future.result().scenes[yielded:]:
+            yield scene
+
+
+def resume_generation(client, poller, generation_id, model):
+    """Re-attach to a generation started by an earlier render.
+
+    Returns the completed generation, or None if it failed or can no longer
+    be fetched, in which case the caller starts a new one.
+    """
+    try:
+        generation = client.generations.get(id=generation_id)
+    except Exception as e:
+        print(f"Cannot resume generation {generation_id}: {str(e)}")
+        return None
+    if generation.state == "failed":
+        return None
+    if generation.state != "completed":
+        print(f"Re-attaching to running generation {generation_id}")
+        try:
+            generation = poller.watch(client, generation_id, model).result()
+        except Exception as e:
+            print(f"Resumed generation {generation_id} failed: {str(e)}")
+            return None
+    return generation
+
+
+def remove_stale_files(folder, keep):
+    """Delete everything in folder except the named files."""
+    for name in os.listdir(folder):
+        if name not in keep:
+            path = os.path.join(folder, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+def render_music_video(
+    job,
+    session_id,
+    audio_file_path,
+    aspect_ratio,
+    brightness,
+    contrast,
+    image_folder,
+    video_folder,
+    output_folder,
+    public_folder,
+    song_analyzer,
+    checkpoint_path,
+    stitch_folder,
+    max_workers=5,
+    asset_cache=None,
+    stitch_processes=None,
+    hedge_percentile=0.9,
+    hedge_budget=0,
+    hls_folder=None,
+    preview_url=None,
+    tier="standard",
+    approved_scenes=None,
+):
+    """Run the full analysis -> images -> videos -> stitch pipeline.
+
+    Progress is checkpointed per scene, so running it again for the same
+    session only redoes scenes that are unfinished or failed. With
+    hls_folder set, a progressive HLS preview is written there and
+    preview_url is published on the job once its first segment exists.
+
+    tier picks the models and encoder settings (see RENDER_TIERS). With
+    approved_scenes, only those scenes are brought up to the tier; the
+    others keep the clips they already have.
+    """
+
+    # Generate video
+    client = get_luma_client()
+    poller = get_generation_poller()
+    checkpoint = RenderCheckpoint(checkpoint_path)
+    # Provider calls from every render share one set of adaptive limits
+    governor = get_governor()
+    # Straggling video generations may be duplicated, within a budget
+    hedge = None
+    if hedge_budget > 0:
+        hedge = HedgePolicy(
+            percentile=hedge_percentile, budget=hedge_budget, governor=governor
+        )
+
+    settings = RENDER_TIERS[tier]
+    image_model = settings["image_model"]
+    video_model = settings["video_model"]
+    resolution = settings["resolution"]
+    video_spec = video_generation_spec(video_model, resolution)
+
+    def scene_fingerprint(scene):
+        return {
+            "image_prompt": scene.image_prompt,
+            "video_prompt": scene.video_prompt,
+            "aspect_ratio": aspect_ratio,
+        }
+
+    def keeps_existing_clip(i):
+        """Scenes left out of an approval list keep the clip they have."""
+        return approved_scenes is not None and i not in approved_scenes
+
+    def record_generation(i, kind, spec):
+        return lambda generation_id: checkpoint.update_scene(
+            i,
+            **{
+                f"{kind}_generation_id": generation_id,
+                f"{kind}_generation_spec": spec,
+            },
+        )
+
+    def generate_and_save_image(i, scene):
+        entry = checkpoint.scene(i, scene_fingerprint(scene))
+        image_path = os.path.join(image_folder, f"image_{i:03d}.jpg")
+        if entry.get("image_url") and os.path.exists(image_path):
+            # Final renders animate the approved draft images as they are
+            if (
+                settings["keep_keyframes"]
+                or keeps_existing_clip(i)
+                or entry.get("image_model", IMAGE_MODEL) == image_model
+            ):
+                print(f"Image for scene {i} already done")
+                return entry["image_url"]
+
+        # A new image invalidates any video made from the old one
+        checkpoint.update_scene(
+            i,
+            state="generating_image",
+            video_generation_id=None,
+            video_url=None,
+            error=None,
+        )
+        cache_key = generation_cache_key(
+            "image", scene.image_prompt, aspect_ratio, image_model
+        )
+        image_url = None
+        if not entry.get("fresh"):
+            image_url = fetch_cached_asset(asset_cache, cache_key, image_path)
+        if image_url:
+            print(f"Reused cached image for scene {i}")
+            checkpoint.update_scene(
+                i,
+                state="image_ready",
+                image_url=image_url,
+                image_path=image_path,
+                image_model=image_model,
+            )
+            return image_url
+
+        generation = None
+        resumable = entry.get("image_generation_spec", IMAGE_MODEL) == image_model
+        if entry.get("image_generation_id") and resumable:
+            generation = resume_generation(
+                client, poller, entry["image_generation_id"], image_model
+            )
+        if generation is not None:
+            image_url = generation.assets.image
+        else:
+            image_url = governor.call(
+                "luma",
+                image_model,
+                functools.partial(test_image_generation, model=image_model),
+                client,
+                scene.image_prompt,
+                aspect_ratio,
+                on_created=record_generation(i, "image", image_model),
+                job_id=job.id,
+            )
+        stats = download_file(
+            image_url, image_path, allow_file_urls=luma_is_fake()
+        )
+        print(
+            f"File downloaded as {os.path.basename(image_path)} "
+            f"({stats['bytes_per_second'] / 1024:.0f} KB/s)"
+        )
+        if asset_cache is not None:
+            asset_cache.put(cache_key, image_url, image_path)
+        checkpoint.update_scene(
+            i,
+            state="image_ready",
+            image_url=image_url,
+            image_path=image_path,
+            image_model=image_model,
+        )
+        return image_url
+
+    def generate_and_save_video(i, scene, image_url):
+        entry = checkpoint.scene(i, scene_fingerprint(scene))
+        video_path = os.path.join(video_folder, f"video_{i:03d}.mp4")
+        if entry.get("video_url") and os.path.exists(video_path):
+            if keeps_existing_clip(i) or (
+                entry.get("video_spec", DEFAULT_VIDEO_SPEC) == video_spec
+            ):
+                print(f"Video for scene {i} already done")
+                return entry["video_url"]
+
+        checkpoint.update_scene(i, state="generating_video", error=None)
+        options = {"resolution": resolution} if resolution else {}
+        cache_key = generation_cache_key(
+            "video",
+            scene.video_prompt,
+            aspect_ratio,
+            video_model,
+            keyframe=image_url,
+            duration=VIDEO_DURATION,
+            **options,
+        )
+        video_url = None
+        if not entry.get("fresh"):
+            video_url = fetch_cached_asset(asset_cache, cache_key, video_path)
+        if video_url:
+            print(f"Reused cached video for scene {i}")
+            checkpoint.update_scene(
+                i,
+                state="completed",
+                video_url=video_url,
+                video_path=video_path,
+                video_spec=video_spec,
+            )
+            return video_url
+
+        generation = None
+        resumable = (
+            entry.get("video_generation_spec", DEFAULT_VIDEO_SPEC) == video_spec
+        )
+        if entry.get("video_generation_id") and resumable:
+            generation = resume_generation(
+                client, poller, entry["video_generation_id"], video_model
+            )
+        if generation is not None:
+            video_url = generation.assets.video
+        else:
+            video_url = governor.call(
+                "luma",
+                video_model,
+                functools.partial(
+                    video_generation, model=video_model, resolution=resolution
+                ),
+                client,
+                scene.video_prompt,
+                image_url,
+                aspect_ratio,
+                hedge=hedge,
+                on_created=record_generation(i, "video", video_spec),
+                job_id=job.id,
+            )
+        stats = download_file(
+            video_url, video_path, allow_file_urls=luma_is_fake()
+        )
+        print(
+            f"Video downloaded as {os.path.basename(video_path)} "
+            f"({stats['bytes_per_second'] / 1024:.0f} KB/s)"
+        )
+        if asset_cache is not None:
+            asset_cache.put(cache_key, video_url, video_path)
+        checkpoint.update_scene(
+            i,
+            state="completed",
+            video_url=video_url,
+            video_path=video_path,
+            video_spec=video_spec,
+            fresh=False,
+        )
+        return video_url
+
+    def checkpointed(i, fn, *args):
+        """Run one scene step, recording a failure in the checkpoint."""
+        try:
+            return fn(i, *args)
+        except Exception as e:
+            print(f"Error generating scene {i}: {str(e)}")
+            checkpoint.update_scene(i, state="failed", error=str(e))
+            raise
+
+    for folder in (image_folder, video_folder):
+        os.makedirs(folder, exist_ok=True)
+
+    # A retried render picks up the storyboard it was working from, so its
+    # finished scenes still match
+    storyboard = checkpoint.storyboard()
+    if storyboard is not None:
+        print(f"Resuming from a checkpoint of {len(storyboard)} scenes")
+        scenes = [Scene(**scene) for scene in storyboard]
+    else:
+        job.update_progress("Analyzing song")
+        scenes = song_analyzer.iter_scenes(session_id, audio_file_path)
+
+    # With a preview folder, finished clips also go out as a live HLS
+    # playlist, in scene order, while later scenes are still generating
+    playlist = None
+    if hls_folder is not None:
+        playlist = ProgressivePlaylist(
+            hls_folder,
+            audio_file=audio_file_path,
+            brightness=brightness,
+            contrast=contrast,
+            on_segment=lambda _: job.set_preview_url(preview_url),
+            output_args=x264_args(**settings["encode"], faststart=False),
+        )
+
+    def add_preview_segment(i, future):
+        if not future.cancelled() and future.exception() is None:
+            playlist.add_clip(i, os.path.join(video_folder, f"video_{i:03d}.mp4"))
+
+    # Each scene starts as soon as the analysis has produced it, and its
+    # video starts as soon as its own image is ready; both stages share the
+    # same bounded pool of workers
+    failed = None
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers
+        ) as executor:
+            rendered_scenes = []
+            scene_futures = []
+            for i, scene in enumerate(scenes):
+                job.update_progress(f"Generating scene {i + 1}")
+                rendered_scenes.append(scene)
+                image_future = executor.submit(
+                    checkpointed, i, generate_and_save_image, scene
+                )
+                scene_future = submit_after(
+                    executor,
+                    image_future,
+                    functools.partial(
+                        checkpointed, i, generate_and_save_video, scene
+                    ),
+                )
+                if playlist is not None:
+                    scene_future.add_done_callback(
+                        functools.partial(add_preview_segment, i)
+                    )
+                scene_futures.append(scene_future)
+            if storyboard is None:
+                checkpoint.set_storyboard(
+                    [scene.model_dump() for scene in rendered_scenes]
+                )
+            checkpoint.trim(len(rendered_scenes))
+
+            # Let every scene finish so one failure does not waste the others
+            job.update_progress("Generating scenes")
+            concurrent.futures.wait(scene_futures)
+
+        failed = [
+            i for i, f in enumerate(scene_futures) if f.exception() is not None
+        ]
+    finally:
+        if playlist is not None:
+            playlist.finish(complete=failed == [])
+
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(scene_futures)} scenes failed "
+            f"(scenes {', '.join(str(i) for i in failed)}); "
+            "generate again to retry only those scenes"
+        )
+
+    # Drop clips left over from an earlier, possibly longer, render
+    remove_stale_files(
+        image_folder,
+        [f"image_{i:03d}.jpg" for i in range(len(rendered_scenes))],
+    )
+    remove_stale_files(
+        video_folder,
+        [f"video_{i:03d}.mp4" for i in range(len(rendered_scenes))],
+    )
+
+    job.update_progress("Stitching videos")
+
+    # Create proper output path with filename
+    output_file = os.path.join(output_folder, "output.mp4")
+
+    # Keep the ungraded clips and encoded audio so /regrade is cheap
+    stitch_with_intermediates(
+        get_video_files_from_directory(video_folder),
+        output_file,
+        stitch_folder,
+        audio_file=audio_file_path,
+        normalize_resolution=True,
+        brightness=brightness,
+        contrast=contrast,
+        max_processes=stitch_processes,
+        output_args=x264_args(**settings["encode"]),
+    )
+
+    if asset_cache is not None:
+        print(f"Asset cache: {asset_cache.stats()}")
+    if hedge is not None:
+        print(f"Hedged {hedge.fired} of {hedge_budget} allowed generations")
+
+    result = publish_output(output_file, public_folder, session_id)
+    result.update(
+        filename=os.path.basename(audio_file_path),
+        filepath=audio_file_path,
+    )
+    return result
+
+
+def publish_output(output_file, public_folder, session_id):
+    """Copy a session's video into the Next.js public directory."""
+    public_name = f"{session_id}.mp4"
+    public_output_file = os.path.join(public_folder, public_name)
+    shutil.copy2(output_file, public_output_file)
+
+    return {
+        "session_id": session_id,
+        "output_file": output_file,
+        # Versioned so the browser does not keep showing an earlier render
+        "videoUrl": f"/assets/output/{public_name}?v={int(time.time())}",
+    }
+
+
+def regenerate_scene(
+    job, scene_index, image_prompt=None, video_prompt=None, **render_params
+):
+    """Regenerate one scene of the session's storyboard and re-stitch.
+
+    Edited prompts are saved into the stored storyboard. Every other scene
+    is reused from the checkpoint, and stitching re-encodes only the new
+    clip. render_params are those of render_music_video().
+    """
+    checkpoint = RenderCheckpoint(render_params["checkpoint_path"])
+    storyboard = checkpoint.storyboard()
+    if storyboard is None or not 0 <= scene_index < len(storyboard):
+        raise ValueError(f"Scene {scene_index} is not in the storyboard")
+
+    prompts = {}
+    if image_prompt:
+        prompts["image_prompt"] = image_prompt
+    if video_prompt:
+        prompts["video_prompt"] = video_prompt
+    # A new video prompt alone can animate the existing image again
+    checkpoint.redo_scene(
+        scene_index, keep_image=bool(prompts) and not image_prompt, **prompts
+    )
+    # Only one scene changes, so skip the progressive preview
+    render_params.update(
+        hls_folder=None, preview_url=None, approved_scenes=[scene_index]
+    )
+    return render_music_video(job, **render_params)
+
+
+def regrade_music_video(
+    job,
+    session_id,
+    brightness,
+    contrast,
+    stitch_folder,
+    output_folder,
+    public_folder,
+    stitch_processes=None,
+):
+    """Re-apply brightness/contrast to a session's last render."""
+    job.update_progress("Regrading video")
+    output_file = os.path.join(output_folder, "output.mp4")
+    regrade_video(
+        stitch_folder,
+        output_file,
+        brightness=brightness,
+        contrast=contrast,
+        max_processes=stitch_processes,
+    )
+    return publish_output(output_file, public_folder, session_id)
+
+
+def export_music_video(job, session_id, output_folder, public_folder):
+    """Export every aspect ratio and a poster from the session's video."""
+    job.update_progress("Exporting renditions")
+    output_file = os.path.join(output_folder, "output.mp4")
+    renditions = export_renditions(
+        output_file, os.path.join(output_folder, "renditions")
+    )
+
+    urls = {}
+    version = int(time.time())
+    for name, path in renditions.items():
+        public_name = f"{session_id}_{os.path.basename(path)}"
+        shutil.copy2(path, os.path.join(public_folder, public_name))
+        urls[name] = f"/assets/output/{public_name}?v={version}"
+    return {"session_id": session_id, "renditions": urls}
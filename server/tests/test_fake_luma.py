@@ -0,0 +1,127 @@
+import os
+import sys
+import tempfile
+import unittest
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from generate_content.fake_luma import FakeLumaClient
+from generate_content.generation_poller import (
+    GenerationPoller,
+    generation_from_payload,
+)
+
+MODEL = "fake-model"
+
+
+def local_path(url):
+    return urllib.request.url2pathname(urllib.parse.urlparse(url).path)
+
+
+def make_poller(client, expected):
+    """A callback-mode poller whose callbacks come from the fake client."""
+    poller = GenerationPoller(expected_durations={MODEL: expected})
+    poller.enable_callbacks("http://localhost/luma/callback")
+    client.deliver = lambda payload: poller.complete(
+        generation_from_payload(payload)
+    )
+    return poller
+
+
+def start(client, poller, prompt, kind="video"):
+    generations = client.generations
+    if kind == "image":
+        generations = client.generations.image
+    generation = generations.create(prompt=prompt, **poller.create_options())
+    return poller.watch(client, generation.id, MODEL)
+
+
+class FakeLumaCallbackTest(unittest.TestCase):
+    def test_callback_completes_generation_without_polling(self):
+        client = FakeLumaClient(duration=0.05)
+        # Polling would not start for a minute, so only a callback can win
+        poller = make_poller(client, expected=30.0)
+
+        generation = start(client, poller, "a video").result(timeout=5)
+
+        self.assertEqual(generation.state, "completed")
+        self.assertEqual(generation.assets.video, client.video_url)
+        self.assertEqual(poller.callbacks, 1)
+        self.assertEqual(client.get_calls, 0)
+
+    def test_dropped_callback_falls_back_to_polling(self):
+        client = FakeLumaClient(duration=0.05, drop_callbacks=True)
+        poller = make_poller(client, expected=0.1)
+
+        generation = start(client, poller, "an image", "image").result(
+            timeout=10
+        )
+
+        self.assertEqual(generation.assets.image, client.image_url)
+        self.assertEqual(poller.callbacks, 0)
+        self.assertGreater(client.get_calls, 0)
+
+    def test_failed_generation_raises(self):
+        client = FakeLumaClient(duration=0.05)
+        poller = make_poller(client, expected=30.0)
+
+        future = start(client, poller, "a video [fail]")
+
+        with self.assertRaisesRegex(RuntimeError, "Fake failure"):
+            future.result(timeout=5)
+
+    def test_failed_callback_without_reason_resolves(self):
+        client = FakeLumaClient(duration=30.0, drop_callbacks=True)
+        poller = make_poller(client, expected=30.0)
+        generation = client.generations.create(
+            prompt="a video", **poller.create_options()
+        )
+        future = poller.watch(client, generation.id, MODEL)
+
+        finished = poller.complete(
+            generation_from_payload({"id": generation.id, "state": "failed"})
+        )
+
+        self.assertTrue(finished)
+        with self.assertRaisesRegex(RuntimeError, "Generation failed"):
+            future.result(timeout=5)
+
+
+class FakeLumaAssetsTest(unittest.TestCase):
+    def test_assets_are_real_local_files(self):
+        client = FakeLumaClient()
+        with open(local_path(client.image_url), "rb") as f:
+            self.assertEqual(f.read(2), b"\xff\xd8")  # JPEG
+        with open(local_path(client.video_url), "rb") as f:
+            self.assertEqual(f.read(12)[4:8], b"ftyp")  # MP4
+
+    def test_download_copies_file_urls(self):
+        try:
+            from utils.download import download_file
+        except ImportError as e:
+            self.skipTest(str(e))
+        client = FakeLumaClient()
+        with tempfile.TemporaryDirectory() as folder:
+            dest = os.path.join(folder, "video.mp4")
+            stats = download_file(client.video_url, dest, allow_file_urls=True)
+            self.assertEqual(
+                stats["bytes"], os.path.getsize(local_path(client.video_url))
+            )
+
+    def test_download_refuses_file_urls_by_default(self):
+        try:
+            from utils.download import download_file
+        except ImportError as e:
+            self.skipTest(str(e))
+        client = FakeLumaClient()
+        with tempfile.TemporaryDirectory() as folder:
+            dest = os.path.join(folder, "video.mp4")
+            with self.assertRaises(ValueError):
+                download_file(client.video_url, dest)
+            self.assertFalse(os.path.exists(dest))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.governor import AdaptiveLimiter, ProviderGovernor, error_outcome
+
+
+def make_limiter(**overrides):
+    limits = {
+        "rate": 1000.0,
+        "burst": 100,
+        "initial_concurrency": 4,
+        "min_concurrency": 1,
+        "max_concurrency": 8,
+    }
+    limits.update(overrides)
+    return AdaptiveLimiter(**limits)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class RateLimitError(Exception):
+    """Named like the Luma SDK's error type."""
+
+
+class ErrorOutcomeTest(unittest.TestCase):
+    def test_status_codes_and_error_types(self):
+        self.assertEqual(error_outcome(StatusError(429)), "throttled")
+        self.assertEqual(error_outcome(RateLimitError("slow down")), "throttled")
+        self.assertEqual(error_outcome(StatusError(503)), "overloaded")
+        self.assertEqual(error_outcome(TimeoutError("no reply")), "overloaded")
+        self.assertEqual(error_outcome(StatusError(400)), "error")
+
+    def test_generation_ids_in_messages_are_not_throttling(self):
+        error = RuntimeError(
+            "Generation 3f2a429c-7d1e-4b1a-9c2e-0a1b2c3d4e5f did not finish"
+        )
+        self.assertEqual(error_outcome(error), "error")
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def test_success_grows_limit_up_to_max(self):
+        limiter = make_limiter(initial_concurrency=2, max_concurrency=3)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release("success")
+        self.assertEqual(limiter.limit, 3)
+        self.assertEqual(limiter.completed, 20)
+
+    def test_throttling_halves_limit_and_empties_bucket(self):
+        limiter = make_limiter(rate=0.001, initial_concurrency=4)
+        limiter.acquire()
+        limiter.release("throttled")
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.throttled, 1)
+        self.assertFalse(limiter.try_acquire())
+
+    def test_limit_never_drops_below_min(self):
+        limiter = make_limiter(initial_concurrency=2, min_concurrency=1)
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release("overloaded")
+        self.assertEqual(limiter.limit, 1)
+
+    def test_unknown_outcome_leaves_limit(self):
+        limiter = make_limiter()
+        limiter.acquire()
+        limiter.release("cancelled")
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_try_acquire_respects_concurrency_limit(self):
+        limiter = make_limiter(initial_concurrency=2)
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.release()
+        self.assertTrue(limiter.try_acquire())
+
+    def test_waiting_jobs_are_admitted_round_robin(self):
+        limiter = make_limiter(initial_concurrency=1, max_concurrency=1)
+        limiter.acquire()  # Hold the only slot while the queue fills
+        order = []
+        threads = []
+
+        def call(job_id):
+            limiter.acquire(job_id)
+            order.append(job_id)
+            limiter.release()
+
+        for job_id in ["a", "a", "a", "b"]:
+            thread = threading.Thread(target=call, args=(job_id,))
+            thread.start()
+            threads.append(thread)
+            # Queue the calls in a known order
+            while limiter.stats()["queue_depth"] < len(threads):
+                time.sleep(0.001)
+
+        limiter.release()
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(order, ["a", "b", "a", "a"])
+
+
+class ProviderGovernorTest(unittest.TestCase):
+    def test_call_feeds_outcome_back(self):
+        governor = ProviderGovernor()
+
+        def throttled():
+            raise StatusError(429)
+
+        with self.assertRaises(StatusError):
+            governor.call("luma", "ray-2", throttled)
+        limiter = governor.limiter("luma", "ray-2")
+        self.assertEqual(limiter.throttled, 1)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertIsNot(limiter, governor.limiter("luma", "ray-flash-2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
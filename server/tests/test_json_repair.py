@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from generate_content.json_repair import repair_json
+
+STORYBOARD = {
+    "song_analysis": {"genre": "city pop", "mood": "wistful"},
+    "scenes": [
+        {"scene_number": 1, "video_prompt": "neon rain", "image_prompt": "a"},
+        {"scene_number": 2, "video_prompt": "train, night", "image_prompt": "b"},
+    ],
+}
+
+
+def repaired(text):
+    return json.loads(repair_json(text))
+
+
+class RepairJsonTest(unittest.TestCase):
+    def test_valid_json_is_unchanged(self):
+        text = json.dumps(STORYBOARD)
+        self.assertEqual(repaired(text), STORYBOARD)
+
+    def test_markdown_fence_and_prose(self):
+        text = (
+            "Here is the storyboard:\n```json\n"
+            + json.dumps(STORYBOARD, indent=2)
+            + "\n```\nEnjoy!"
+        )
+        self.assertEqual(repaired(text), STORYBOARD)
+
+    def test_unterminated_fence(self):
+        text = "```json\n" + json.dumps(STORYBOARD)
+        self.assertEqual(repaired(text), STORYBOARD)
+
+    def test_comments_are_dropped(self):
+        text = """{
+          // copied from the prompt template
+          "song_analysis": {"genre": "city pop", "mood": "wistful"},
+          "scenes": []  // filled in below
+        }"""
+        self.assertEqual(
+            repaired(text),
+            {"song_analysis": {"genre": "city pop", "mood": "wistful"},
+             "scenes": []},
+        )
+
+    def test_slashes_inside_strings_are_kept(self):
+        text = '{"url": "https://example.com/a", "note": "a // b"}'
+        self.assertEqual(
+            repaired(text), {"url": "https://example.com/a", "note": "a // b"}
+        )
+
+    def test_trailing_commas(self):
+        text = '{"scenes": [{"scene_number": 1,}, {"scene_number": 2},],}'
+        self.assertEqual(
+            repaired(text),
+            {"scenes": [{"scene_number": 1}, {"scene_number": 2}]},
+        )
+
+    def test_truncated_mid_string(self):
+        text = '{"song_analysis": {"genre": "city po'
+        self.assertEqual(
+            repaired(text), {"song_analysis": {"genre": "city po"}}
+        )
+
+    def test_truncated_mid_scene_keeps_complete_scenes(self):
+        text = json.dumps(STORYBOARD)
+        cut = text.index("train") + 3
+        self.assertEqual(
+            repaired(text[:cut]),
+            {**STORYBOARD, "scenes": STORYBOARD["scenes"][:1]},
+        )
+
+    def test_truncated_after_comma(self):
+        text = '{"scenes": [{"scene_number": 1}, '
+        self.assertEqual(repaired(text), {"scenes": [{"scene_number": 1}]})
+
+    def test_raw_newlines_in_strings_are_escaped(self):
+        text = '{"video_prompt": "first line\nsecond line"}'
+        self.assertEqual(
+            repaired(text), {"video_prompt": "first line\nsecond line"}
+        )
+
+    def test_escaped_quotes_stay_in_string(self):
+        text = '{"video_prompt": "she says \\"go\\", then"'
+        self.assertEqual(repaired(text), {"video_prompt": 'she says "go", then'})
+
+
+if __name__ == "__main__":
+    unittest.main()
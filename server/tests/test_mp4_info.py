@@ -0,0 +1,161 @@
+import os
+import sys
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.mp4_info import MP4ParseError, read_mp4_video_info
+
+VIDEOS_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "..", "assets", "videos"
+)
+
+
+def box(box_type, *payloads):
+    payload = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def large_box(box_type, *payloads):
+    """A box written with a 64-bit size, as large mdat boxes are."""
+    payload = b"".join(payloads)
+    return struct.pack(">I4sQ", 1, box_type, 16 + len(payload)) + payload
+
+
+def full_box(box_type, payload, version=0):
+    return box(box_type, bytes([version, 0, 0, 0]), payload)
+
+
+def mdhd(timescale, duration, version=0):
+    if version == 1:
+        return full_box(
+            b"mdhd", struct.pack(">QQIQ", 0, 0, timescale, duration), 1
+        )
+    return full_box(b"mdhd", struct.pack(">IIII", 0, 0, timescale, duration))
+
+
+def track(
+    handler,
+    width=0,
+    height=0,
+    timescale=12288,
+    duration=64000,
+    sample_entry=b"avc1",
+    stts=((125, 512),),
+    mdhd_version=0,
+):
+    # Width and height are 16.16 fixed point values at the end of tkhd
+    tkhd = full_box(
+        b"tkhd", bytes(72) + struct.pack(">II", width << 16, height << 16)
+    )
+    hdlr = full_box(b"hdlr", bytes(4) + handler + bytes(12))
+    stsd = full_box(
+        b"stsd",
+        struct.pack(">I", 1) + struct.pack(">I4s", 16, sample_entry) + bytes(8),
+    )
+    stts_box = full_box(
+        b"stts",
+        struct.pack(">I", len(stts))
+        + b"".join(struct.pack(">II", count, delta) for count, delta in stts),
+    )
+    stbl = box(b"stbl", stsd, stts_box)
+    mdia = box(
+        b"mdia",
+        mdhd(timescale, duration, mdhd_version),
+        hdlr,
+        box(b"minf", stbl),
+    )
+    return box(b"trak", tkhd, mdia)
+
+
+def movie(*tracks, movie_duration=None):
+    payloads = []
+    if movie_duration is not None:
+        payloads.append(
+            full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, movie_duration))
+        )
+    return (
+        box(b"ftyp", b"isom")
+        + large_box(b"mdat", bytes(32))
+        + box(b"moov", *payloads, *tracks)
+    )
+
+
+class ReadMp4VideoInfoTest(unittest.TestCase):
+    def read(self, data):
+        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as f:
+            f.write(data)
+        self.addCleanup(os.remove, f.name)
+        return read_mp4_video_info(f.name)
+
+    def test_real_clip(self):
+        info = read_mp4_video_info(os.path.join(VIDEOS_DIR, "video_0.mp4"))
+        self.assertEqual((info["width"], info["height"]), (1280, 720))
+        self.assertEqual(info["codec"], "h264")
+        self.assertEqual(info["frame_rate"], "24/1")
+        self.assertAlmostEqual(info["duration"], 5.208, places=3)
+
+    def test_video_track_after_audio_track(self):
+        info = self.read(
+            movie(track(b"soun", sample_entry=b"mp4a"), track(b"vide", 720, 1280))
+        )
+        self.assertEqual((info["width"], info["height"]), (720, 1280))
+        self.assertEqual(info["codec"], "h264")
+        self.assertAlmostEqual(info["duration"], 64000 / 12288)
+
+    def test_version_1_media_header(self):
+        info = self.read(
+            movie(
+                track(
+                    b"vide", 640, 360, timescale=600, duration=3000, mdhd_version=1
+                )
+            )
+        )
+        self.assertEqual(info["duration"], 5.0)
+
+    def test_frame_rate_from_most_common_delta(self):
+        info = self.read(
+            movie(
+                track(
+                    b"vide",
+                    640,
+                    360,
+                    timescale=30000,
+                    stts=((1, 2000), (299, 1001)),
+                )
+            )
+        )
+        self.assertEqual(info["frame_rate"], "30000/1001")
+
+    def test_unknown_codec_keeps_its_code(self):
+        info = self.read(movie(track(b"vide", 640, 360, sample_entry=b"apch")))
+        self.assertEqual(info["codec"], "apch")
+
+    def test_falls_back_to_movie_duration(self):
+        info = self.read(
+            movie(track(b"vide", 640, 360, duration=0), movie_duration=4500)
+        )
+        self.assertEqual(info["duration"], 4.5)
+
+    def test_no_moov(self):
+        with self.assertRaises(MP4ParseError):
+            self.read(box(b"ftyp", b"isom") + box(b"mdat", bytes(16)))
+
+    def test_no_video_track(self):
+        with self.assertRaises(MP4ParseError):
+            self.read(movie(track(b"soun", sample_entry=b"mp4a")))
+
+    def test_missing_dimensions(self):
+        with self.assertRaises(MP4ParseError):
+            self.read(movie(track(b"vide")))
+
+    def test_invalid_box_size(self):
+        data = box(b"ftyp", b"isom") + struct.pack(">I4s", 4, b"moov")
+        with self.assertRaises(MP4ParseError):
+            self.read(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
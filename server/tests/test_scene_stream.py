@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from generate_content.scene_stream import SceneStreamParser
+
+SCENES = [
+    {"scene_number": 1, "video_prompt": "neon {rain}", "image_prompt": "a"},
+    {"scene_number": 2, "video_prompt": 'say "hi" ]', "image_prompt": "b"},
+    {"scene_number": 3, "video_prompt": "tokyo", "image_prompt": "c"},
+]
+FIRST_SCENE_END = '"image_prompt": "a"}'
+RESPONSE = json.dumps(
+    {"song_analysis": {"genre": "city pop", "tags": ["a", "b"]}, "scenes": SCENES}
+)
+
+
+def feed_in_chunks(parser, text, size):
+    scenes = []
+    for start in range(0, len(text), size):
+        scenes.extend(parser.feed(text[start : start + size]))
+    return scenes
+
+
+class SceneStreamParserTest(unittest.TestCase):
+    def test_whole_response(self):
+        self.assertEqual(SceneStreamParser().feed(RESPONSE), SCENES)
+
+    def test_scenes_split_across_chunks(self):
+        for size in (1, 2, 7, 64):
+            with self.subTest(size=size):
+                scenes = feed_in_chunks(SceneStreamParser(), RESPONSE, size)
+                self.assertEqual(scenes, SCENES)
+
+    def test_scene_is_returned_as_soon_as_it_closes(self):
+        parser = SceneStreamParser()
+        end = RESPONSE.index(FIRST_SCENE_END) + len(FIRST_SCENE_END)
+        self.assertEqual(parser.feed(RESPONSE[:end]), SCENES[:1])
+        self.assertEqual(parser.feed(RESPONSE[end:]), SCENES[1:])
+
+    def test_markdown_fence_is_ignored(self):
+        text = "```json\n" + RESPONSE + "\n```"
+        self.assertEqual(feed_in_chunks(SceneStreamParser(), text, 5), SCENES)
+
+    def test_nested_objects_outside_scenes_are_ignored(self):
+        text = json.dumps(
+            {"song_analysis": {"scenes": [{"scene_number": 9}]}, "scenes": []}
+        )
+        self.assertEqual(SceneStreamParser().feed(text), [])
+
+    def test_truncated_response_yields_complete_scenes(self):
+        cut = RESPONSE.index('"scene_number": 3')
+        self.assertEqual(SceneStreamParser().feed(RESPONSE[:cut]), SCENES[:2])
+
+    def test_repairable_scene_is_kept(self):
+        text = RESPONSE.replace('"image_prompt": "b"}', '"image_prompt": "b",}')
+        self.assertEqual(feed_in_chunks(SceneStreamParser(), text, 3), SCENES)
+
+    def test_unusable_scene_stops_the_stream(self):
+        # Skipping scene 2 would hand scene 3 out in its place
+        text = RESPONSE.replace('"scene_number": 2,', '"scene_number": 2 2,')
+        parser = SceneStreamParser()
+        self.assertEqual(feed_in_chunks(parser, text, 3), SCENES[:1])
+        self.assertEqual(parser.feed("{}"), [])
+
+    def test_stop_ends_the_stream(self):
+        parser = SceneStreamParser()
+        end = RESPONSE.index(FIRST_SCENE_END) + len(FIRST_SCENE_END)
+        self.assertEqual(parser.feed(RESPONSE[:end]), SCENES[:1])
+        parser.stop()
+        self.assertEqual(parser.feed(RESPONSE[end:]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import io
+import os
+import sys
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils import uploads
+from utils.uploads import UploadError, UploadStore
+
+SONG = bytes(range(256)) * 1024  # 256 KiB, larger than one proof range
+SONG_SHA256 = hashlib.sha256(SONG).hexdigest()
+
+
+def upload(store, data=SONG, sha256=SONG_SHA256, chunk_size=100_000):
+    upload_id = store.start("song.mp3", len(data), ".mp3", sha256)
+    for offset in range(0, len(data), chunk_size):
+        status = store.append(
+            upload_id, offset, io.BytesIO(data[offset : offset + chunk_size])
+        )
+    return status
+
+
+class StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.store = UploadStore(folder.name)
+
+
+class UploadStoreTest(StoreTestCase):
+    def test_chunks_are_stored_by_hash(self):
+        status = upload(self.store)
+        self.assertEqual(status["sha256"], SONG_SHA256)
+        path = self.store.stored_path(SONG_SHA256, ".mp3")
+        self.assertEqual(status["path"], path)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), SONG)
+        self.assertEqual(self.store.find_by_hash(SONG_SHA256, ".mp3"), path)
+
+    def test_status_reports_offset_for_resume(self):
+        upload_id = self.store.start("song.mp3", len(SONG), ".mp3", SONG_SHA256)
+        self.store.append(upload_id, 0, io.BytesIO(SONG[:1000]))
+
+        status = self.store.status(upload_id)
+        self.assertEqual(status["offset"], 1000)
+        self.assertEqual(status["size"], len(SONG))
+
+    def test_chunk_at_wrong_offset_is_refused(self):
+        upload_id = self.store.start("song.mp3", len(SONG), ".mp3", SONG_SHA256)
+        self.store.append(upload_id, 0, io.BytesIO(SONG[:1000]))
+
+        with self.assertRaises(UploadError):
+            self.store.append(upload_id, 500, io.BytesIO(SONG[500:1500]))
+        self.assertEqual(self.store.status(upload_id)["offset"], 1000)
+
+    def test_hash_is_rebuilt_after_restart(self):
+        upload_id = self.store.start("song.mp3", len(SONG), ".mp3", SONG_SHA256)
+        self.store.append(upload_id, 0, io.BytesIO(SONG[:1000]))
+
+        restarted = UploadStore(self.store.uploads_folder)
+        status = restarted.append(upload_id, 1000, io.BytesIO(SONG[1000:]))
+        self.assertEqual(status["sha256"], SONG_SHA256)
+
+    def test_hash_mismatch_is_refused(self):
+        with self.assertRaises(UploadError):
+            upload(self.store, sha256="0" * 64)
+        self.assertIsNone(self.store.find_by_hash("0" * 64, ".mp3"))
+
+    def test_oversized_upload_is_refused(self):
+        upload_id = self.store.start("song.mp3", 10, ".mp3")
+        with self.assertRaises(UploadError):
+            self.store.append(upload_id, 0, io.BytesIO(b"x" * 11))
+
+    def test_unknown_or_malformed_ids(self):
+        self.assertIsNone(self.store.status("0" * 32))
+        self.assertIsNone(self.store.status("../../etc/passwd"))
+        with self.assertRaises(UploadError):
+            self.store.append("0" * 32, 0, io.BytesIO(b"x"))
+
+    def test_find_by_hash_rejects_malformed_hashes(self):
+        self.assertIsNone(self.store.find_by_hash("../song", ".mp3"))
+        self.assertIsNone(self.store.find_by_hash(None, ".mp3"))
+
+
+class UploadProofTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = upload(self.store)["path"]
+
+    def test_correct_range_hash_proves_the_file(self):
+        challenge_id, offset, length = self.store.challenge(self.path, size=1)
+        self.assertEqual(length, uploads.PROOF_RANGE_SIZE)
+        answer = hashlib.sha256(SONG[offset : offset + length]).hexdigest()
+
+        challenge, proven = self.store.verify(challenge_id, answer)
+        self.assertTrue(proven)
+        self.assertEqual(challenge["size"], 1)
+
+    def test_whole_file_hash_is_not_proof(self):
+        challenge_id, _, _ = self.store.challenge(self.path)
+        challenge, proven = self.store.verify(challenge_id, SONG_SHA256)
+        self.assertIsNotNone(challenge)
+        self.assertFalse(proven)
+
+    def test_challenge_is_good_for_one_try(self):
+        challenge_id, offset, length = self.store.challenge(self.path)
+        answer = hashlib.sha256(SONG[offset : offset + length]).hexdigest()
+        self.store.verify(challenge_id, "wrong")
+
+        self.assertEqual(self.store.verify(challenge_id, answer), (None, False))
+
+    def test_expired_challenge(self):
+        challenge_id, offset, length = self.store.challenge(self.path)
+        answer = hashlib.sha256(SONG[offset : offset + length]).hexdigest()
+        expired = uploads.time.time() + uploads.PROOF_TTL + 1
+        with mock.patch.object(uploads.time, "time", return_value=expired):
+            self.assertEqual(self.store.verify(challenge_id, answer), (None, False))
+
+    def test_range_covers_small_files_whole(self):
+        small = b"tiny song"
+        status = upload(self.store, small, hashlib.sha256(small).hexdigest())
+        _, offset, length = self.store.challenge(status["path"])
+        self.assertEqual((offset, length), (0, len(small)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import threading
+
+
+class RenderCheckpoint:
+    """Per-session record of a render's storyboard and scene progress.
+
+    Each scene entry keeps the prompts and settings it was generated for,
+    the Luma generation IDs and asset URLs, the local files and a state
+    (pending, generating_image, image_ready, generating_video, completed
+    or failed). It is rewritten after every change, so a retried render,
+    even in a fresh server process, can skip finished scenes and re-attach
+    to generations that were still running.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            data = {}
+        data.setdefault("storyboard", None)
+        data.setdefault("scenes", {})
+        return data
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def storyboard(self):
+        """Return the saved list of scene dicts, or None."""
+        with self._lock:
+            return self._data["storyboard"]
+
+    def set_storyboard(self, scenes):
+        with self._lock:
+            self._data["storyboard"] = scenes
+            self._save()
+
+    def scene(self, index, fingerprint):
+        """Return a copy of the scene's entry for these prompts/settings.
+
+        If the entry was made for a different fingerprint it is replaced
+        by a fresh pending one.
+        """
+        key = str(index)
+        with self._lock:
+            entry = self._data["scenes"].get(key)
+            if entry is None or entry.get("fingerprint") != fingerprint:
+                entry = {"fingerprint": fingerprint, "state": "pending"}
+                self._data["scenes"][key] = entry
+                self._save()
+            return dict(entry)
+
+    def update_scene(self, index, **fields):
+        with self._lock:
+            entry = self._data["scenes"][str(index)]
+            entry.update(fields, updated_at=time.time())
+            self._save()
+
+    def redo_scene(self, index, keep_image=False, **prompts):
+        """Mark one scene to be generated again, with any edited prompts.
+
+        The prompts are written into the storyboard and the scene's
+        fingerprint, so the next render regenerates just this scene,
+        bypassing the asset cache. With keep_image its current image is
+        reused as the video's keyframe.
+        """
+        with self._lock:
+            self._data["storyboard"][index].update(prompts)
+            entry = self._data["scenes"].get(str(index))
+            if entry is not None:
+                entry["fingerprint"].update(prompts)
+                cleared = ["video_generation_id", "video_url"]
+                if not keep_image:
+                    cleared += ["image_generation_id", "image_url"]
+                for field in cleared:
+                    entry.pop(field, None)
+                entry["state"] = "pending"
+                entry["fresh"] = True
+            self._save()
+
+    def trim(self, scene_count):
+        """Forget entries for scenes past the end of the storyboard."""
+        with self._lock:
+            scenes = self._data["scenes"]
+            for key in [k for k in scenes if int(k) >= scene_count]:
+                del scenes[key]
+            self._save()
+
+    def summary(self):
+        """Count scenes by state."""
+        with self._lock:
+            counts = {}
+            for entry in self._data["scenes"].values():
+                counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+            return counts
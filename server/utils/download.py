@@ -0,0 +1,91 @@
+import os
+import time
+import shutil
+import threading
+import urllib.parse
+import urllib.request
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+CHUNK_SIZE = 1024 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_download_session():
+    """Return the process-wide pooled HTTP session used for asset downloads."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def download_file(url, dest_path, max_retries=3, timeout=30, allow_file_urls=False):
+    """Stream url to dest_path and return transfer statistics.
+
+    The body is written in chunks to a temporary ".part" file that is renamed
+    into place once complete, so readers never see a half written asset. If
+    the connection drops, the download resumes from the bytes already on
+    disk with an HTTP Range request. file:// URLs (such as the fake Luma
+    client's assets) are copied, but only with allow_file_urls: URLs come
+    from provider and callback data, which must never read local files.
+    """
+    is_file_url = urllib.parse.urlparse(url).scheme.lower() == "file"
+    if is_file_url and not allow_file_urls:
+        raise ValueError(f"Refusing to download local file URL: {url}")
+
+    part_path = f"{dest_path}.part"
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+    started_at = time.monotonic()
+    if is_file_url:
+        source = urllib.request.url2pathname(urllib.parse.urlparse(url).path)
+        shutil.copyfile(source, part_path)
+    else:
+        _download_http(url, part_path, max_retries, timeout)
+
+    os.replace(part_path, dest_path)
+    elapsed = time.monotonic() - started_at
+    size = os.path.getsize(dest_path)
+    return {
+        "bytes": size,
+        "seconds": elapsed,
+        "bytes_per_second": size / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def _download_http(url, part_path, max_retries, timeout):
+    session = get_download_session()
+    attempt = 0
+    while True:
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(
+                url, headers=headers, stream=True, timeout=timeout
+            ) as response:
+                response.raise_for_status()
+                # Append only if the server honoured the Range header
+                mode = "ab" if offset and response.status_code == 206 else "wb"
+                with open(part_path, mode) as file:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        file.write(chunk)
+            break
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ) as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            print(f"Download of {url} interrupted ({str(e)}), resuming...")
+            time.sleep(min(2 ** attempt, 10))
@@ -0,0 +1,244 @@
+import time
+import threading
+import collections
+
+
+# Starting limits per provider. "rate" is calls per second refilled into the
+# token bucket, "burst" its capacity, and the concurrency values bound how
+# many calls may be in flight at once while AIMD adjusts the limit.
+DEFAULT_LIMITS = {
+    "gemini": {
+        "rate": 1.0,
+        "burst": 5,
+        "initial_concurrency": 4,
+        "min_concurrency": 1,
+        "max_concurrency": 16,
+    },
+    "luma": {
+        "rate": 2.0,
+        "burst": 10,
+        "initial_concurrency": 8,
+        "min_concurrency": 1,
+        "max_concurrency": 32,
+    },
+}
+FALLBACK_LIMITS = DEFAULT_LIMITS["gemini"]
+
+
+def is_throttle_error(error):
+    """Check whether an SDK error means the provider is rate limiting us.
+
+    Only status codes and error types count: messages can hold generation
+    ids, which may contain "429" by chance.
+    """
+    for attr in ("status_code", "code", "status"):
+        if getattr(error, attr, None) in (429, "429", "RESOURCE_EXHAUSTED"):
+            return True
+    # The Luma SDK's RateLimitError, matched by name so the SDK stays an
+    # optional import here
+    return any(cls.__name__ == "RateLimitError" for cls in type(error).__mro__)
+
+
+def is_overload_error(error):
+    """Check whether an SDK error points at provider-side trouble."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    for attr in ("status_code", "code"):
+        status = getattr(error, attr, None)
+        if isinstance(status, int) and status >= 500:
+            return True
+    return False
+
+
+def error_outcome(error):
+    """Map a failed call's error to a limiter release() outcome."""
+    if is_throttle_error(error):
+        return "throttled"
+    if is_overload_error(error):
+        return "overloaded"
+    return "error"
+
+
+class AdaptiveLimiter:
+    """Token bucket plus AIMD concurrency limit for one provider/model.
+
+    Waiting calls are queued per job and admitted round-robin across jobs,
+    so one large render cannot starve the others. Every success grows the
+    concurrency limit by about one per limit's worth of calls; throttling or
+    provider errors halve it.
+    """
+
+    def __init__(
+        self,
+        rate,
+        burst,
+        initial_concurrency,
+        min_concurrency,
+        max_concurrency,
+        decrease_factor=0.5,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.decrease_factor = decrease_factor
+        self.limit = float(initial_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self.completed = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._queues = collections.OrderedDict()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._refilled_at) * self.rate
+        )
+        self._refilled_at = now
+
+    def _next_waiter(self):
+        """Return the waiter at the head of the round-robin order."""
+        for queue in self._queues.values():
+            if queue:
+                return queue[0]
+        return None
+
+    def acquire(self, job_id=None):
+        waiter = object()
+        with self._cond:
+            self._queues.setdefault(job_id, collections.deque()).append(waiter)
+            while True:
+                self._refill()
+                can_run = (
+                    self._next_waiter() is waiter
+                    and self.in_flight < int(self.limit)
+                    and self._tokens >= 1
+                )
+                if can_run:
+                    break
+                if self._tokens < 1:
+                    timeout = (1 - self._tokens) / self.rate
+                else:
+                    timeout = None
+                self._cond.wait(timeout=timeout)
+
+            self._tokens -= 1
+            self.in_flight += 1
+            queue = self._queues.pop(job_id)
+            queue.popleft()
+            if queue:
+                # Move this job to the back so other jobs go next
+                self._queues[job_id] = queue
+            self._cond.notify_all()
+
+    def try_acquire(self):
+        """Take a slot only if one is free now and no call is waiting.
+
+        For optional extra calls, which should never queue ahead of (or
+        alongside) required ones. Returns whether a slot was taken.
+        """
+        with self._cond:
+            self._refill()
+            if (
+                self._next_waiter() is not None
+                or self.in_flight >= int(self.limit)
+                or self._tokens < 1
+            ):
+                return False
+            self._tokens -= 1
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome="success"):
+        """Return a slot; outcome is success, throttled, overloaded or error.
+
+        Any other outcome (such as "cancelled") leaves the limit as it is.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "success":
+                self.completed += 1
+                self.limit = min(
+                    self.max_concurrency, self.limit + 1 / self.limit
+                )
+            elif outcome in ("throttled", "overloaded"):
+                self.limit = max(
+                    self.min_concurrency, self.limit * self.decrease_factor
+                )
+                if outcome == "throttled":
+                    self.throttled += 1
+                    # Empty the bucket so new calls back off for a moment
+                    self._tokens = min(self._tokens, 0.0)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            self._refill()
+            return {
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queue_depth": sum(len(q) for q in self._queues.values()),
+                "waiting_jobs": sum(1 for q in self._queues.values() if q),
+                "tokens": round(self._tokens, 2),
+                "rate_per_second": self.rate,
+                "completed": self.completed,
+                "throttled": self.throttled,
+            }
+
+
+class ProviderGovernor:
+    """Process-wide registry of limiters, one per (provider, model)."""
+
+    def __init__(self, limits=None):
+        self.limits = limits or DEFAULT_LIMITS
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, provider, model):
+        key = (provider, model)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = AdaptiveLimiter(
+                    **self.limits.get(provider, FALLBACK_LIMITS)
+                )
+                self._limiters[key] = limiter
+            return limiter
+
+    def call(self, provider, model, fn, *args, job_id=None, **kwargs):
+        """Run fn under the provider/model limiter and feed back the outcome."""
+        limiter = self.limiter(provider, model)
+        limiter.acquire(job_id)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            limiter.release(error_outcome(e))
+            raise
+        limiter.release("success")
+        return result
+
+    # For callers that manage limiter slots themselves
+    error_outcome = staticmethod(error_outcome)
+
+    def stats(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {
+            f"{provider}/{model}": limiter.stats()
+            for (provider, model), limiter in limiters.items()
+        }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """Return the process-wide governor for provider calls."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = ProviderGovernor()
+        return _governor
@@ -0,0 +1,189 @@
+import os
+import re
+import math
+import shutil
+import threading
+import concurrent.futures
+
+from utils.stitch_videos import (
+    X264_ENCODE_ARGS,
+    build_video_filters,
+    get_video_info,
+    run_ffmpeg,
+)
+
+
+PLAYLIST_NAME = "index.m3u8"
+
+
+class ProgressivePlaylist:
+    """Live HLS playlist that grows one scene clip at a time.
+
+    Clips may finish in any order. Each one is encoded, together with its
+    slice of the song, into a single MPEG-TS segment as soon as every
+    earlier clip has been, and appended to an EVENT playlist that players
+    can start on right away. finish() ends the playlist.
+
+    Segments are separate ffmpeg runs, so they use MPEG-TS (self-contained,
+    with timestamps carried on from the previous segment) rather than fMP4,
+    which would need one shared init segment.
+
+    Only Safari plays HLS natively, so the same encode also writes each
+    segment as a self-initializing fragmented MP4 of the same name with an
+    ".mp4" extension. Other browsers append those to a Media Source
+    Extensions buffer in playlist order (see client/lib/live-preview.ts).
+    """
+
+    def __init__(
+        self,
+        output_dir,
+        audio_file=None,
+        brightness=50,
+        contrast=50,
+        target_duration=10,
+        on_segment=None,
+        output_args=None,
+    ):
+        self.output_dir = output_dir
+        self.audio_file = audio_file
+        self.brightness = brightness
+        self.contrast = contrast
+        self.target_duration = target_duration
+        self.on_segment = on_segment
+        self.output_args = output_args or X264_ENCODE_ARGS
+        self.segments = []
+        self.error = None
+        self._clips = {}
+        self._next_index = 0
+        self._offset = 0.0
+        self._size = None
+        self._lock = threading.Lock()
+        # One encoder thread keeps segments, and their timestamps, in order
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="hls-segments"
+        )
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir, exist_ok=True)
+        self._write_playlist()
+
+    @property
+    def playlist_path(self):
+        return os.path.join(self.output_dir, PLAYLIST_NAME)
+
+    def add_clip(self, index, clip_path):
+        """Queue scene index's clip; it is encoded once its turn comes."""
+        with self._lock:
+            self._clips[index] = clip_path
+            while self._next_index in self._clips:
+                self._executor.submit(
+                    self._encode_segment,
+                    self._next_index,
+                    self._clips.pop(self._next_index),
+                )
+                self._next_index += 1
+
+    def finish(self, complete=True):
+        """Wait for queued segments, then end the playlist if complete.
+
+        Returns True if the playlist was ended.
+        """
+        self._executor.shutdown(wait=True)
+        if not complete or self.error is not None:
+            return False
+        self._write_playlist(ended=True)
+        return True
+
+    def _encode_segment(self, index, clip_path):
+        if self.error is not None:
+            return
+        try:
+            info = get_video_info(clip_path)
+            if info is None:
+                raise ValueError(f"Could not read {clip_path}")
+            if self._size is None:
+                self._size = (int(info["width"]), int(info["height"]))
+            duration = info["duration"]
+
+            name = f"segment_{index:03d}.ts"
+            mse_name = f"segment_{index:03d}.mp4"
+            tmp_path = os.path.join(self.output_dir, f"{name}.tmp")
+            mse_tmp_path = os.path.join(self.output_dir, f"{mse_name}.tmp")
+            cmd = ["ffmpeg", "-y", "-i", str(clip_path)]
+            if self.audio_file:
+                cmd.extend(
+                    ["-ss", f"{self._offset:.3f}", "-t", f"{duration:.3f}"]
+                )
+                cmd.extend(["-i", str(self.audio_file)])
+                cmd.extend(["-map", "0:v:0", "-map", "1:a:0"])
+                cmd.extend(["-c:a", "aac", "-b:a", "192k"])
+            else:
+                # tee has no default streams, so they are always mapped
+                cmd.extend(["-map", "0:v:0"])
+            cmd.extend(
+                [
+                    "-vf",
+                    build_video_filters(
+                        *self._size,
+                        normalize_resolution=True,
+                        brightness=self.brightness,
+                        contrast=self.contrast,
+                    ),
+                    *self.output_args,
+                    # MP4 needs the codec headers up front; the MPEG-TS
+                    # muxer repeats them in band on keyframes itself
+                    "-flags",
+                    "+global_header",
+                    "-t",
+                    f"{duration:.3f}",
+                    "-output_ts_offset",
+                    f"{self._offset:.3f}",
+                    "-f",
+                    "tee",
+                    f"[f=mpegts]{_tee_escape(tmp_path)}|"
+                    "[f=mp4:movflags=frag_keyframe+empty_moov+default_base_moof]"
+                    f"{_tee_escape(mse_tmp_path)}",
+                ]
+            )
+            run_ffmpeg(cmd)
+            # The MSE copy must exist before the playlist lists the segment
+            os.replace(mse_tmp_path, os.path.join(self.output_dir, mse_name))
+            os.replace(tmp_path, os.path.join(self.output_dir, name))
+        except Exception as e:
+            print(f"Error writing HLS segment for scene {index}: {str(e)}")
+            self.error = e
+            return
+
+        self.segments.append((name, duration))
+        self._offset += duration
+        self._write_playlist()
+        print(f"HLS segment {name} ready ({duration:.1f}s)")
+        if self.on_segment:
+            self.on_segment(index)
+
+    def _write_playlist(self, ended=False):
+        target = max(
+            [self.target_duration]
+            + [math.ceil(duration) for _, duration in self.segments]
+        )
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{target}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for name, duration in self.segments:
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(name)
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+
+        tmp_path = f"{self.playlist_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.playlist_path)
+
+
+def _tee_escape(path):
+    """Escape a path for use as one of the tee muxer's outputs."""
+    return re.sub(r"([\\'\[\]|])", r"\\\1", path)
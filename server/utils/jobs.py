@@ -0,0 +1,124 @@
+import time
+import uuid
+import threading
+import traceback
+import concurrent.futures
+
+
+class Job:
+    """A single render request tracked by the job queue."""
+
+    def __init__(self, job_id, params):
+        self.id = job_id
+        self.params = params
+        self.status = "queued"
+        self.progress = "Waiting for a free worker"
+        self.result = None
+        self.preview_url = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update_progress(self, message):
+        """Record a human readable description of the current stage."""
+        with self._lock:
+            self.progress = message
+        print(f"[job {self.id}] {message}")
+
+    def set_preview_url(self, url):
+        """Point clients at a partial result they can play meanwhile."""
+        with self._lock:
+            self.preview_url = url
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "progress": self.progress,
+                "result": self.result,
+                "preview_url": self.preview_url,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class JobQueue:
+    """Run render jobs on a persistent, bounded pool of worker threads."""
+
+    def __init__(self, max_workers=2, max_finished_jobs=200):
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="render-worker"
+        )
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, params):
+        """Enqueue fn(job, **params) and return the new job's ID."""
+        job = Job(uuid.uuid4().hex, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune_finished_jobs()
+        self._executor.submit(self._run, job, fn)
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == "queued")
+
+    def status_counts(self):
+        """Count the known jobs by status."""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        counts = {}
+        for status in statuses:
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, fn):
+        with job._lock:
+            job.status = "running"
+            job.started_at = time.time()
+        try:
+            result = fn(job, **job.params)
+            with job._lock:
+                job.status = "completed"
+                job.result = result
+                job.progress = "Done"
+        except Exception as e:
+            traceback.print_exc()
+            with job._lock:
+                job.status = "failed"
+                job.error = str(e)
+        finally:
+            with job._lock:
+                job.finished_at = time.time()
+
+    def _prune_finished_jobs(self):
+        """Forget the oldest finished jobs once there are too many of them."""
+        finished = [
+            job
+            for job in self._jobs.values()
+            if job.status in ("completed", "failed")
+        ]
+        if len(finished) <= self.max_finished_jobs:
+            return
+        finished.sort(key=lambda job: job.finished_at or job.created_at)
+        for job in finished[: len(finished) - self.max_finished_jobs]:
+            del self._jobs[job.id]
@@ -0,0 +1,171 @@
+import struct
+from fractions import Fraction
+
+
+# Sample entry codes mapped to the codec names ffprobe reports
+CODEC_NAMES = {
+    b"avc1": "h264",
+    b"avc3": "h264",
+    b"hvc1": "hevc",
+    b"hev1": "hevc",
+    b"av01": "av1",
+    b"vp09": "vp9",
+    b"mp4v": "mpeg4",
+}
+
+
+class MP4ParseError(ValueError):
+    pass
+
+
+def _iter_boxes(f, start, end):
+    """Yield (type, payload_offset, payload_size) for boxes in [start, end)."""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            raise MP4ParseError(f"Invalid size for box {box_type!r}")
+        yield box_type, offset + header_size, size - header_size
+        offset += size
+
+
+def _find_box(f, start, end, box_type):
+    for found_type, payload_offset, payload_size in _iter_boxes(f, start, end):
+        if found_type == box_type:
+            return payload_offset, payload_size
+    return None
+
+
+def _read_full_box(f, offset, size):
+    """Return (version, payload after the version/flags header)."""
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) < 4:
+        raise MP4ParseError("Truncated box")
+    return data[0], data[4:]
+
+
+def _parse_time_header(f, offset, size):
+    """Parse an mvhd/mdhd box into (timescale, duration)."""
+    version, data = _read_full_box(f, offset, size)
+    if version == 1:
+        return struct.unpack(">QQIQ", data[:28])[2:]
+    return struct.unpack(">IIII", data[:16])[2:]
+
+
+def _parse_video_track(f, offset, size):
+    """Return the video track's metadata, or None for other tracks."""
+    end = offset + size
+    mdia = _find_box(f, offset, end, b"mdia")
+    if mdia is None:
+        return None
+    mdia_end = mdia[0] + mdia[1]
+
+    hdlr = _find_box(f, mdia[0], mdia_end, b"hdlr")
+    if hdlr is None:
+        return None
+    _, hdlr_data = _read_full_box(f, *hdlr)
+    if hdlr_data[4:8] != b"vide":
+        return None
+
+    tkhd = _find_box(f, offset, end, b"tkhd")
+    if tkhd is None:
+        raise MP4ParseError("Video track has no tkhd box")
+    _, tkhd_data = _read_full_box(f, *tkhd)
+    # Width and height are 16.16 fixed point values at the end of tkhd
+    width, height = struct.unpack(">II", tkhd_data[-8:])
+
+    mdhd = _find_box(f, mdia[0], mdia_end, b"mdhd")
+    if mdhd is None:
+        raise MP4ParseError("Video track has no mdhd box")
+    timescale, duration = _parse_time_header(f, *mdhd)
+
+    minf = _find_box(f, mdia[0], mdia_end, b"minf")
+    stbl = minf and _find_box(f, minf[0], minf[0] + minf[1], b"stbl")
+    if not stbl:
+        raise MP4ParseError("Video track has no sample table")
+    stbl_end = stbl[0] + stbl[1]
+
+    codec = None
+    stsd = _find_box(f, stbl[0], stbl_end, b"stsd")
+    if stsd is not None:
+        _, stsd_data = _read_full_box(f, *stsd)
+        if len(stsd_data) >= 12:
+            sample_entry = stsd_data[8:12]
+            codec = CODEC_NAMES.get(sample_entry, sample_entry.decode("latin-1"))
+
+    frame_rate = None
+    stts = _find_box(f, stbl[0], stbl_end, b"stts")
+    if stts is not None:
+        _, stts_data = _read_full_box(f, *stts)
+        (entry_count,) = struct.unpack(">I", stts_data[:4])
+        entries = [
+            struct.unpack(">II", stts_data[4 + i * 8 : 12 + i * 8])
+            for i in range(entry_count)
+        ]
+        sample_count = sum(count for count, _ in entries)
+        total_delta = sum(count * delta for count, delta in entries)
+        if sample_count and total_delta:
+            # The most common sample delta gives the nominal (ffprobe's
+            # r_frame_rate) rate; fall back to the average otherwise
+            _, delta = max(entries, key=lambda entry: entry[0])
+            if delta:
+                rate = Fraction(timescale, delta)
+            else:
+                rate = Fraction(sample_count * timescale, total_delta)
+            frame_rate = f"{rate.numerator}/{rate.denominator}"
+
+    return {
+        "width": width >> 16,
+        "height": height >> 16,
+        "duration": duration / timescale if timescale else None,
+        "codec": codec,
+        "pix_fmt": None,
+        "frame_rate": frame_rate,
+    }
+
+
+def read_mp4_video_info(path):
+    """Read width, height, duration, codec and frame rate from an MP4/MOV.
+
+    Only the moov box is read, so this is cheap even for large files.
+    Raises MP4ParseError if the file has no usable video track.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        moov = _find_box(f, 0, file_size, b"moov")
+        if moov is None:
+            raise MP4ParseError(f"No moov box in {path}")
+        moov_end = moov[0] + moov[1]
+
+        movie_duration = None
+        mvhd = _find_box(f, moov[0], moov_end, b"mvhd")
+        if mvhd is not None:
+            timescale, duration = _parse_time_header(f, *mvhd)
+            if timescale:
+                movie_duration = duration / timescale
+
+        for box_type, offset, size in _iter_boxes(f, moov[0], moov_end):
+            if box_type != b"trak":
+                continue
+            info = _parse_video_track(f, offset, size)
+            if info is None:
+                continue
+            if not info["duration"]:
+                info["duration"] = movie_duration
+            if not info["width"] or not info["height"] or not info["duration"]:
+                raise MP4ParseError(f"Incomplete video metadata in {path}")
+            return info
+
+    raise MP4ParseError(f"No video track in {path}")
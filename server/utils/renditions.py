@@ -0,0 +1,88 @@
+import os
+
+from utils.stitch_videos import X264_OUTPUT_ARGS, get_video_info, run_ffmpeg
+
+
+# Named after the formats the client offers
+RENDITIONS = {
+    "youtube": (1280, 720),
+    "horizontal": (960, 720),
+    "vertical": (720, 1280),
+}
+
+# Crop to fill the frame when that keeps at least this share of the
+# picture; otherwise fit it and pad with a blurred copy of itself
+MIN_CROP_KEEP = 0.7
+
+
+def fit_filter(source_width, source_height, width, height, label="pad"):
+    """Return a filter chain reframing the source to width x height.
+
+    label keeps the chain's internal pad names unique within a graph.
+    """
+    source_ratio = source_width / source_height
+    target_ratio = width / height
+    keep = min(source_ratio, target_ratio) / max(source_ratio, target_ratio)
+    fill = (
+        f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+        f"crop={width}:{height}"
+    )
+    if keep >= MIN_CROP_KEEP:
+        return f"{fill},setsar=1"
+    return (
+        f"split[{label}bg][{label}fg];"
+        f"[{label}bg]{fill},boxblur=20:2[{label}blurred];"
+        f"[{label}fg]scale={width}:{height}:"
+        f"force_original_aspect_ratio=decrease[{label}fit];"
+        f"[{label}blurred][{label}fit]overlay=(W-w)/2:(H-h)/2,setsar=1"
+    )
+
+
+def export_renditions(input_path, output_dir, renditions=None, poster=True):
+    """Export every rendition (and a poster) from one decode of input_path.
+
+    The decoded video is split once per output, and each branch is cropped
+    or padded to its own frame; audio is copied as is. Returns a dict of
+    rendition name -> output path, with the poster under "poster".
+    """
+    renditions = renditions or RENDITIONS
+    info = get_video_info(input_path)
+    if info is None:
+        raise ValueError(f"Could not get video information for {input_path}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    branches = len(renditions) + (1 if poster else 0)
+    graph = [
+        f"[0:v]split={branches}"
+        + "".join(f"[in{i}]" for i in range(branches))
+    ]
+    outputs = {}
+    output_args = []
+    for i, (name, (width, height)) in enumerate(renditions.items()):
+        chain = fit_filter(
+            info["width"], info["height"], width, height, label=f"r{i}"
+        )
+        graph.append(f"[in{i}]{chain}[out{i}]")
+        outputs[name] = os.path.join(output_dir, f"{name}.mp4")
+        output_args.extend(["-map", f"[out{i}]", "-map", "0:a?"])
+        output_args.extend([*X264_OUTPUT_ARGS, "-c:a", "copy", outputs[name]])
+    if poster:
+        # Most representative of the first 100 frames
+        graph.append(f"[in{branches - 1}]thumbnail=100[poster]")
+        outputs["poster"] = os.path.join(output_dir, "poster.jpg")
+        output_args.extend(
+            ["-map", "[poster]", "-frames:v", "1", "-q:v", "2", outputs["poster"]]
+        )
+
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        str(input_path),
+        "-filter_complex",
+        ";".join(graph),
+        *output_args,
+    ]
+    run_ffmpeg(cmd)
+    print(f"Exported {', '.join(outputs)} from {input_path}")
+    return outputs
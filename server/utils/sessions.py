@@ -0,0 +1,91 @@
+import os
+import re
+import json
+import time
+import uuid
+import threading
+
+
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class SessionStore:
+    """Per-upload workspaces, persisted to a JSON index file.
+
+    Every session owns a directory holding its song and the images, clips
+    and output of its renders, so concurrent renders never share files.
+    """
+
+    def __init__(self, root_folder, sessions_file):
+        self.root_folder = root_folder
+        self.sessions_file = sessions_file
+        self._lock = threading.Lock()
+        self._sessions = self._load()
+        os.makedirs(root_folder, exist_ok=True)
+
+    def _load(self):
+        try:
+            with open(self.sessions_file, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.sessions_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._sessions, f, indent=2)
+        os.replace(tmp_path, self.sessions_file)
+
+    def create(self, **fields):
+        """Create a new session and its workspace directories."""
+        session_id = uuid.uuid4().hex
+        workspace = self.workspace(session_id)
+        for folder in ("image_folder", "video_folder", "output_folder"):
+            os.makedirs(workspace[folder], exist_ok=True)
+        with self._lock:
+            self._sessions[session_id] = {"created_at": time.time(), **fields}
+            self._save()
+        return session_id
+
+    def get(self, session_id):
+        if not session_id or not SESSION_ID_PATTERN.match(session_id):
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return dict(session) if session is not None else None
+
+    def update(self, session_id, **fields):
+        with self._lock:
+            self._sessions[session_id].update(fields)
+            self._save()
+
+    def claim(self, session_id, is_busy, start, **fields):
+        """Start a job for a session unless it already has one underway.
+
+        is_busy(job_id) reports whether the session's current job is still
+        running; otherwise start() is called and its return value saved as
+        the session's job_id, along with fields. Both happen under the
+        store's lock, so two requests can never both claim a session.
+        Returns (claimed, job_id), with the running job's ID if not claimed.
+        """
+        with self._lock:
+            session = self._sessions[session_id]
+            if is_busy(session.get("job_id")):
+                return False, session["job_id"]
+            job_id = start()
+            session.update(fields, job_id=job_id)
+            self._save()
+            return True, job_id
+
+    def workspace(self, session_id):
+        """Return the paths that make up a session's working directory."""
+        root = os.path.join(self.root_folder, session_id)
+        return {
+            "root": root,
+            "image_folder": os.path.join(root, "images"),
+            "video_folder": os.path.join(root, "videos"),
+            "output_folder": os.path.join(root, "output"),
+            "checkpoint": os.path.join(root, "render.json"),
+            "stitch_folder": os.path.join(root, "stitch"),
+            "hls_folder": os.path.join(root, "hls"),
+        }
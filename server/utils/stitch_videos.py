@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 import os
 import json
+import struct
+import shutil
+import threading
+import collections
 import tempfile
 import subprocess
+import concurrent.futures
 
 from pathlib import Path
 
+try:
+    from utils.mp4_info import MP4ParseError, read_mp4_video_info
+except ImportError:
+    # Run directly as a script, with this folder rather than server/ on
+    # sys.path
+    from mp4_info import MP4ParseError, read_mp4_video_info
+
 
 def create_concat_file(video_files, temp_dir):
     """Create a temporary file listing videos to concatenate."""
@@ -21,8 +33,57 @@ def create_concat_file(video_files, temp_dir):
     return concat_file_path
 
 
+# Containers the in-process moov parser understands
+MP4_EXTENSIONS = {".mp4", ".mov", ".m4v"}
+
+_video_info_cache = collections.OrderedDict()
+_video_info_cache_lock = threading.Lock()
+VIDEO_INFO_CACHE_SIZE = 1024
+
+
 def get_video_info(video_path):
-    """Get duration and other info about the video file."""
+    """Get duration and other info about the video file.
+
+    MP4/MOV files are read in-process; other containers fall back to
+    ffprobe. Results are cached by (path, size, mtime).
+    """
+    try:
+        stat = os.stat(video_path)
+    except OSError as e:
+        print(f"Error getting video info for {video_path}: {str(e)}")
+        return None
+    cache_key = (
+        os.path.abspath(str(video_path)),
+        stat.st_size,
+        stat.st_mtime_ns,
+    )
+
+    with _video_info_cache_lock:
+        info = _video_info_cache.get(cache_key)
+        if info is not None:
+            _video_info_cache.move_to_end(cache_key)
+            return dict(info)
+
+    info = None
+    if os.path.splitext(str(video_path))[1].lower() in MP4_EXTENSIONS:
+        try:
+            info = read_mp4_video_info(video_path)
+        except (MP4ParseError, struct.error, OSError) as e:
+            print(f"Falling back to ffprobe for {video_path}: {str(e)}")
+    if info is None:
+        info = probe_video_info(video_path)
+    if info is None:
+        return None
+
+    with _video_info_cache_lock:
+        _video_info_cache[cache_key] = info
+        while len(_video_info_cache) > VIDEO_INFO_CACHE_SIZE:
+            _video_info_cache.popitem(last=False)
+    return dict(info)
+
+
+def probe_video_info(video_path):
+    """Get duration and other info about the video file using ffprobe."""
     cmd = [
         "ffprobe",
         "-v",
@@ -30,7 +91,7 @@ def get_video_info(video_path):
         "-select_streams",
         "v:0",
         "-show_entries",
-        "stream=width,height,duration,r_frame_rate",
+        "stream=codec_name,pix_fmt,width,height,duration,r_frame_rate",
         "-of",
         "json",  # Use JSON format for more reliable parsing
         str(video_path),
@@ -66,7 +127,14 @@ def get_video_info(video_path):
             )
             duration = duration_data["format"]["duration"]
 
-        return {"width": width, "height": height, "duration": float(duration)}
+        return {
+            "width": width,
+            "height": height,
+            "duration": float(duration),
+            "codec": stream.get("codec_name"),
+            "pix_fmt": stream.get("pix_fmt"),
+            "frame_rate": stream.get("r_frame_rate"),
+        }
     except (
         subprocess.CalledProcessError,
         json.JSONDecodeError,
@@ -77,6 +145,143 @@ def get_video_info(video_path):
         return None
 
 
+def x264_args(preset="medium", crf=23, faststart=True):
+    """Return libx264 output options for a speed/quality trade-off."""
+    args = [
+        "-c:v",
+        "libx264",
+        "-preset",
+        preset,
+        "-crf",
+        str(crf),
+        "-pix_fmt",
+        "yuv420p",
+    ]
+    if faststart:
+        # Enable fast start for web playback
+        args.extend(["-movflags", "+faststart"])
+    return args
+
+
+# Output options for re-encoded video with better quality settings
+X264_ENCODE_ARGS = x264_args(faststart=False)
+X264_OUTPUT_ARGS = x264_args()
+
+
+def build_video_filters(
+    target_width,
+    target_height,
+    normalize_resolution=False,
+    brightness=50,
+    contrast=50,
+):
+    """Build the scale/pad and color grading filter chain."""
+    # Calculate brightness and contrast values
+    # Convert from 0-100 range to FFmpeg's expected ranges
+    # Brightness: -1.0 to 1.0
+    # Contrast: 0.0 to 2.0
+    brightness_value = ((brightness - 50) / 50) * 1.0
+    contrast_value = 1.0 + (contrast - 50) / 50
+
+    # Build video filters
+    filters = []
+    if normalize_resolution:
+        filters.append(
+            f"scale={target_width}:{target_height}:force_original_aspect_ratio=decrease,pad={target_width}:{target_height}:(ow-iw)/2:(oh-ih)/2"
+        )
+
+    # Add brightness and contrast filters
+    filters.append(
+        f"eq=brightness={brightness_value}:contrast={contrast_value}"
+    )
+
+    # Combine all filters
+    return ",".join(filters)
+
+
+def can_stream_copy(video_info_list, brightness=50, contrast=50):
+    """Check whether clips can be joined without re-encoding.
+
+    That is only possible when no color adjustment is requested and every
+    clip shares the same codec, pixel format, resolution and frame rate.
+    """
+    if brightness != 50 or contrast != 50:
+        return False
+
+    def stream_format(info):
+        return (
+            info.get("codec"),
+            info.get("pix_fmt"),
+            info["width"],
+            info["height"],
+            info.get("frame_rate"),
+        )
+
+    first = stream_format(video_info_list[0])
+    # The pixel format may be unknown when read without ffprobe
+    if None in first[:1] + first[2:]:
+        return False
+    return all(stream_format(info) == first for info in video_info_list[1:])
+
+
+def run_ffmpeg(cmd):
+    """Run an ffmpeg command, printing its stderr if it fails."""
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"FFmpeg error: {e.stderr}")
+        raise
+
+
+def normalize_clip(
+    input_path, output_path, video_filters, threads=0, output_args=None
+):
+    """Scale and color grade a single clip into a silent H.264 file."""
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        str(input_path),
+        "-vf",
+        video_filters,
+        "-threads",
+        str(threads),
+        *(output_args or X264_OUTPUT_ARGS),
+        "-an",
+        str(output_path),
+    ]
+    run_ffmpeg(cmd)
+    return output_path
+
+
+def encode_clips_parallel(
+    pairs, video_filters, max_processes=None, output_args=None
+):
+    """Encode (input, output) clip pairs in their own ffmpeg processes.
+
+    Each process gets an equal share of the cores so the pool as a whole
+    keeps all of them busy. Outputs only appear once fully written.
+    """
+    if not pairs:
+        return
+    cpu_count = os.cpu_count() or 1
+    max_processes = max(1, min(max_processes or cpu_count, len(pairs)))
+    threads = max(1, cpu_count // max_processes)
+
+    def encode(src, dst):
+        tmp_path = f"{dst}.tmp.mp4"
+        normalize_clip(src, tmp_path, video_filters, threads, output_args)
+        os.replace(tmp_path, dst)
+
+    # Threads only wait on the ffmpeg child processes doing the work
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_processes
+    ) as executor:
+        futures = [executor.submit(encode, src, dst) for src, dst in pairs]
+        for future in futures:
+            future.result()
+
+
 def concatenate_videos(
     video_files,
     output_path,
@@ -84,96 +289,259 @@ def concatenate_videos(
     normalize_resolution=False,
     brightness=50,
     contrast=50,
+    max_processes=None,
 ):
-    """Concatenate multiple videos into one, optionally adding audio."""
+    """Concatenate multiple videos into one, optionally adding audio.
+
+    A one-off stitch_with_intermediates() in a temporary directory: clips
+    that already share one format are joined with stream copy, others are
+    scaled and graded in one encode each, several processes at a time.
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        stitch_with_intermediates(
+            video_files,
+            output_path,
+            work_dir,
+            audio_file=audio_file,
+            normalize_resolution=normalize_resolution,
+            brightness=brightness,
+            contrast=contrast,
+            max_processes=max_processes,
+        )
+    finally:
+        # Clean up temporary files
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def encode_audio_track(audio_file, output_path):
+    """Encode the song to AAC once, so later stitches can copy it as is."""
+    if os.path.exists(output_path) and os.path.getmtime(
+        output_path
+    ) >= os.path.getmtime(audio_file):
+        return output_path
+    tmp_path = f"{output_path}.tmp.m4a"
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        str(audio_file),
+        "-vn",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "192k",
+        tmp_path,
+    ]
+    run_ffmpeg(cmd)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return [os.path.abspath(str(path)), stat.st_size, stat.st_mtime_ns]
+
+
+def prepare_intermediates(video_files, clips_dir, previous=None):
+    """Keep a copy of every clip in clips_dir.
+
+    Copies, so a later render rewriting the originals cannot change what a
+    regrade of this one sees. Clips whose source file is unchanged since
+    the previous manifest are reused. Returns (manifest clip entries,
+    indices of the clips that were redone).
+    """
+    reusable = {}
+    if previous:
+        reusable = {tuple(entry["source"]): entry for entry in previous["clips"]}
+
+    entries = []
+    changed = []
+    for i, video_file in enumerate(video_files):
+        signature = _source_signature(video_file)
+        clip = os.path.join(clips_dir, f"clip_{i:04d}.mp4")
+        entries.append({"source": signature, "clip": clip})
+        old = reusable.get(tuple(signature))
+        if old is not None and old["clip"] == clip and os.path.exists(clip):
+            continue
+        changed.append(i)
+        shutil.copy2(video_file, f"{clip}.tmp.mp4")
+        os.replace(f"{clip}.tmp.mp4", clip)
+    return entries, changed
+
+
+def stitch_settings(clips, normalize_resolution=True, output_args=None):
+    """Decide how clips are brought into one format for joining.
+
+    Clips that already match each other are joined as they are ("copy");
+    otherwise every clip is scaled to the largest one's size.
+    """
+    video_info_list = [get_video_info(c) for c in clips]
+    if not all(video_info_list):
+        raise ValueError("Could not get video information for all files")
+    # Draft and final clips may be mixed; never scale the larger ones down
+    largest = max(video_info_list, key=lambda info: info["width"] * info["height"])
+    return {
+        "mode": "copy" if can_stream_copy(video_info_list) else "normalize",
+        "target": [int(largest["width"]), int(largest["height"])],
+        "normalize_resolution": normalize_resolution,
+        "output_args": output_args or X264_OUTPUT_ARGS,
+    }
+
+
+def _remove_extra_clips(folder, clip_names):
+    for name in os.listdir(folder):
+        if name not in clip_names:
+            os.remove(os.path.join(folder, name))
+
+
+def join_clips(clips, output_path, audio_track=None):
+    """Stream copy clips of one format into output_path, with an AAC track."""
     temp_dir = tempfile.mkdtemp()
     try:
-        # Create concat file
-        concat_file = create_concat_file(video_files, temp_dir)
-
-        # Get dimensions of all videos
-        video_info_list = [get_video_info(v) for v in video_files]
-        if not all(video_info_list):
-            raise ValueError("Could not get video information for all files")
-
-        # Use the dimensions of the first video as the target
-        target_width = int(video_info_list[0]["width"])
-        target_height = int(video_info_list[0]["height"])
-
-        # Build ffmpeg command
-        cmd = ["ffmpeg", "-y"]
-
-        # Add input files
-        cmd.extend(["-f", "concat", "-safe", "0", "-i", concat_file])
-        if audio_file:
-            cmd.extend(["-i", str(audio_file)])
-
-        # Calculate brightness and contrast values
-        # Convert from 0-100 range to FFmpeg's expected ranges
-        # Brightness: -1.0 to 1.0
-        # Contrast: 0.0 to 2.0
-        brightness_value = ((brightness - 50) / 50) * 1.0
-        contrast_value = 1.0 + (contrast - 50) / 50
-
-        # Build video filters
-        filters = []
-        if normalize_resolution:
-            filters.append(
-                f"scale={target_width}:{target_height}:force_original_aspect_ratio=decrease,pad={target_width}:{target_height}:(ow-iw)/2:(oh-ih)/2"
-            )
+        concat_file = create_concat_file(clips, temp_dir)
+        cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", concat_file]
+        if audio_track:
+            cmd.extend(["-i", str(audio_track), "-map", "0:v:0", "-map", "1:a:0"])
+            cmd.extend(["-c:a", "copy", "-shortest"])
+        cmd.extend(["-c:v", "copy", "-movflags", "+faststart", str(output_path)])
+        run_ffmpeg(cmd)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
-        # Add brightness and contrast filters
-        filters.append(
-            f"eq=brightness={brightness_value}:contrast={contrast_value}"
-        )
 
-        # Combine all filters
-        if filters:
-            cmd.extend(["-vf", ",".join(filters)])
-
-        # Add output options with better quality settings
-        cmd.extend(
-            [
-                "-c:v",
-                "libx264",
-                "-preset",
-                "medium",
-                "-crf",
-                "23",
-                "-pix_fmt",
-                "yuv420p",
-                "-movflags",
-                "+faststart",  # Enable fast start for web playback
-            ]
-        )
+STITCH_MANIFEST = "manifest.json"
 
-        # Add audio options if audio file is provided
-        if audio_file:
-            cmd.extend(
-                [
-                    "-c:a",
-                    "aac",
-                    "-b:a",
-                    "192k",
-                    "-shortest",  # Ensure video and audio lengths match
-                ]
-            )
 
-        cmd.append(str(output_path))
+def _write_stitch_manifest(work_dir, manifest):
+    tmp_path = os.path.join(work_dir, f"{STITCH_MANIFEST}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(work_dir, STITCH_MANIFEST))
 
-        # Execute ffmpeg command with error handling
-        try:
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
-            print(f"Successfully created merged video: {output_path}")
-        except subprocess.CalledProcessError as e:
-            print(f"FFmpeg error: {e.stderr}")
-            raise
 
-    finally:
-        # Clean up temporary files
-        if os.path.exists(concat_file):
-            os.remove(concat_file)
-        os.rmdir(temp_dir)
+def load_stitch_manifest(work_dir):
+    """Return the manifest of the last stitch in work_dir, or None."""
+    try:
+        with open(os.path.join(work_dir, STITCH_MANIFEST), "r") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    # Written before clips were kept as plain copies
+    if "settings" not in manifest:
+        return None
+    if not all(os.path.exists(entry["clip"]) for entry in manifest["clips"]):
+        return None
+    return manifest
+
+
+def stitch_with_intermediates(
+    video_files,
+    output_path,
+    work_dir,
+    audio_file=None,
+    normalize_resolution=True,
+    brightness=50,
+    contrast=50,
+    max_processes=None,
+    output_args=None,
+):
+    """Stitch clips, keeping what a later restitch or regrade needs.
+
+    work_dir keeps a copy of each clip, the clips as encoded for the
+    current grade, the song encoded once as AAC and a manifest listing
+    them. Stitching again after one clip changed only re-encodes that clip
+    and stream copies the rest; regrade_video() redoes just the encodes.
+    """
+    clips_dir = os.path.join(work_dir, "clips")
+    graded_dir = os.path.join(work_dir, "graded")
+    os.makedirs(clips_dir, exist_ok=True)
+    os.makedirs(graded_dir, exist_ok=True)
+
+    previous = load_stitch_manifest(work_dir)
+    entries, changed = prepare_intermediates(video_files, clips_dir, previous)
+    clip_names = {os.path.basename(entry["clip"]) for entry in entries}
+    _remove_extra_clips(clips_dir, clip_names)
+    settings = stitch_settings(
+        [entry["clip"] for entry in entries], normalize_resolution, output_args
+    )
+
+    grade = None
+    if previous and previous["settings"] == settings:
+        grade = previous.get("grade")
+        # Encodes of redone clips are stale
+        for i in changed:
+            graded_path = os.path.join(graded_dir, f"clip_{i:04d}.mp4")
+            if os.path.exists(graded_path):
+                os.remove(graded_path)
+        _remove_extra_clips(graded_dir, clip_names)
+    else:
+        _remove_extra_clips(graded_dir, set())
+
+    audio_track = None
+    if audio_file:
+        audio_track = encode_audio_track(
+            audio_file, os.path.join(work_dir, "audio.m4a")
+        )
+    manifest = {
+        "settings": settings,
+        "clips": entries,
+        "audio_track": audio_track,
+        "grade": grade,
+    }
+    _write_stitch_manifest(work_dir, manifest)
+    regrade_video(work_dir, output_path, brightness, contrast, max_processes)
+
+
+def regrade_video(
+    work_dir, output_path, brightness=50, contrast=50, max_processes=None
+):
+    """Rebuild the output from the kept intermediates with a given grade.
+
+    Clips that share one format are joined as they are when the grade is
+    neutral. Otherwise each clip is scaled (if needed) and color graded in
+    a single encode, one clip per process, reusing clips already encoded
+    for this grade. Everything is then joined with stream copy and the
+    cached audio track.
+    """
+    manifest = load_stitch_manifest(work_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No stitched intermediates in {work_dir}")
+
+    settings = manifest["settings"]
+    clips = [entry["clip"] for entry in manifest["clips"]]
+    grade = [brightness, contrast]
+    if settings["mode"] != "copy" or grade != [50, 50]:
+        graded_dir = os.path.join(work_dir, "graded")
+        if manifest.get("grade") != grade:
+            _remove_extra_clips(graded_dir, set())
+        graded = [os.path.join(graded_dir, os.path.basename(c)) for c in clips]
+        pairs = [
+            (clip, graded_path)
+            for clip, graded_path in zip(clips, graded)
+            if not os.path.exists(graded_path)
+        ]
+        print(f"Encoding {len(pairs)} of {len(clips)} clips")
+        encode_clips_parallel(
+            pairs,
+            build_video_filters(
+                *settings["target"],
+                normalize_resolution=(
+                    settings["mode"] == "normalize"
+                    and settings["normalize_resolution"]
+                ),
+                brightness=brightness,
+                contrast=contrast,
+            ),
+            max_processes,
+            settings["output_args"],
+        )
+        clips = graded
+
+    manifest["grade"] = grade
+    _write_stitch_manifest(work_dir, manifest)
+    join_clips(clips, output_path, manifest["audio_track"])
+    print(f"Successfully created merged video: {output_path}")
 
 
 def get_video_files_from_directory(directory):
@@ -201,6 +569,7 @@ def merge_videos_with_audio(
     normalize=True,
     brightness=50,
     contrast=50,
+    max_processes=None,
 ):
     """Merge all videos in a directory with optional audio file."""
     try:
@@ -221,6 +590,7 @@ def merge_videos_with_audio(
             normalize_resolution=normalize,
             brightness=brightness,
             contrast=contrast,
+            max_processes=max_processes,
         )
         return True
 
@@ -0,0 +1,197 @@
+import os
+import re
+import json
+import hmac
+import time
+import uuid
+import hashlib
+import secrets
+import threading
+
+
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Skipping the transfer of a known file takes the SHA-256 of a random
+# range of it, answered within PROOF_TTL seconds
+PROOF_RANGE_SIZE = 64 * 1024
+PROOF_TTL = 10 * 60
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadStore:
+    """Chunked, resumable uploads into a content-addressed song store.
+
+    An upload is started with the file's name, size and (optionally) its
+    SHA-256. If a file with that hash was uploaded before, the client only
+    has to prove it holds the same file by hashing a byte range the server
+    picks (see challenge()). Otherwise chunks are appended to a ".part"
+    file at the offset the server reports, hashing as they are written,
+    and the finished file is moved to "<sha256><ext>" in the store.
+    """
+
+    def __init__(self, uploads_folder):
+        self.uploads_folder = uploads_folder
+        self.pending_folder = os.path.join(uploads_folder, "pending")
+        self.store_folder = os.path.join(uploads_folder, "by-hash")
+        os.makedirs(self.pending_folder, exist_ok=True)
+        os.makedirs(self.store_folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._hashers = {}
+        self._upload_locks = {}
+        self._challenges = {}
+
+    def stored_path(self, sha256, ext):
+        return os.path.join(self.store_folder, f"{sha256}{ext}")
+
+    def find_by_hash(self, sha256, ext):
+        """Return the stored file for a content hash, or None."""
+        if not sha256 or not SHA256_PATTERN.match(sha256):
+            return None
+        path = self.stored_path(sha256, ext)
+        return path if os.path.exists(path) else None
+
+    def challenge(self, path, **extra):
+        """Pick a random byte range of a stored file for the client to hash.
+
+        Returns (challenge_id, offset, length); extra fields come back from
+        verify() once the range is hashed correctly.
+        """
+        size = os.path.getsize(path)
+        length = min(PROOF_RANGE_SIZE, size)
+        offset = secrets.randbelow(size - length + 1)
+        challenge_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            for key, pending in list(self._challenges.items()):
+                if now - pending["created_at"] > PROOF_TTL:
+                    del self._challenges[key]
+            self._challenges[challenge_id] = {
+                "path": path,
+                "offset": offset,
+                "length": length,
+                "created_at": now,
+                **extra,
+            }
+        return challenge_id, offset, length
+
+    def verify(self, challenge_id, sha256):
+        """Check a challenge's answer; each challenge is good for one try.
+
+        Returns (challenge, proven), with challenge None if it is unknown
+        or expired. proven is True if sha256 is the challenged range's hash.
+        """
+        with self._lock:
+            pending = self._challenges.pop(challenge_id, None)
+        if pending is None or time.time() - pending["created_at"] > PROOF_TTL:
+            return None, False
+        with open(pending["path"], "rb") as f:
+            f.seek(pending["offset"])
+            expected = hashlib.sha256(f.read(pending["length"])).hexdigest()
+        return pending, hmac.compare_digest(expected, str(sha256 or "").lower())
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.pending_folder, f"{upload_id}.json")
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.pending_folder, f"{upload_id}.part")
+
+    def start(self, filename, size, ext, sha256=None, **extra):
+        """Begin an upload; extra fields are kept and returned on completion."""
+        upload_id = uuid.uuid4().hex
+        meta = {
+            "filename": filename,
+            "size": int(size),
+            "ext": ext,
+            "sha256": sha256,
+            **extra,
+        }
+        with open(self._meta_path(upload_id), "w") as f:
+            json.dump(meta, f)
+        open(self._part_path(upload_id), "wb").close()
+        return upload_id
+
+    def status(self, upload_id):
+        """Return the upload's metadata plus how many bytes have arrived."""
+        if not upload_id or not UPLOAD_ID_PATTERN.match(upload_id):
+            return None
+        try:
+            with open(self._meta_path(upload_id), "r") as f:
+                meta = json.load(f)
+            meta["offset"] = os.path.getsize(self._part_path(upload_id))
+        except (OSError, json.JSONDecodeError):
+            return None
+        meta["upload_id"] = upload_id
+        return meta
+
+    def _upload_lock(self, upload_id):
+        with self._lock:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+
+    def _hasher(self, upload_id, part_path):
+        """Return the running hash of the bytes written so far.
+
+        If the server restarted mid-upload, the hash is rebuilt from disk.
+        """
+        hasher = self._hashers.get(upload_id)
+        if hasher is None:
+            hasher = hashlib.sha256()
+            with open(part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+            self._hashers[upload_id] = hasher
+        return hasher
+
+    def append(self, upload_id, offset, stream):
+        """Stream a chunk onto the upload at offset.
+
+        Returns the updated status. Once every byte has arrived the file is
+        verified and moved into the store, and the status gains a "path".
+        """
+        meta = self.status(upload_id)
+        if meta is None:
+            raise UploadError("Unknown upload")
+
+        with self._upload_lock(upload_id):
+            part_path = self._part_path(upload_id)
+            current = os.path.getsize(part_path)
+            if offset != current:
+                raise UploadError(
+                    f"Chunk starts at {offset} but the upload is at {current}"
+                )
+
+            hasher = self._hasher(upload_id, part_path)
+            written = current
+            with open(part_path, "ab") as f:
+                for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+                    written += len(chunk)
+                    if written > meta["size"]:
+                        raise UploadError("Upload is larger than announced")
+                    f.write(chunk)
+                    hasher.update(chunk)
+            meta["offset"] = written
+
+            if written == meta["size"]:
+                meta["path"] = self._finish(upload_id, meta, hasher.hexdigest())
+                meta["sha256"] = hasher.hexdigest()
+        return meta
+
+    def _finish(self, upload_id, meta, digest):
+        part_path = self._part_path(upload_id)
+        try:
+            if meta.get("sha256") and meta["sha256"] != digest:
+                raise UploadError("Uploaded file does not match its hash")
+            path = self.stored_path(digest, meta["ext"])
+            os.replace(part_path, path)
+            return path
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            os.remove(self._meta_path(upload_id))
+            with self._lock:
+                self._hashers.pop(upload_id, None)
+                self._upload_locks.pop(upload_id, None)